@@ -0,0 +1,104 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Company type classifier, find the keywords of every company type by scanning name once
+"""
+
+from utils.util_automaton import KeywordAutomaton
+
+# Company type rules in order of precedence: Samples property name, company type, keywords, excluded following word.
+# The bank keyword doesn't count if it's followed by '保险', e.g. '银行保险部'.
+COMPANY_TYPE_RULES = (
+    ('bank', '银行', ('银行',), '保险'),
+    ('insurance_appraisal', '公估公司', ('公估',), None),
+    ('insurance_economic', '经纪公司', ('经纪',), None),
+    ('insurance_agency', '代理公司', ('代理',), None),
+    ('insurance_sale', '代理公司', ('销售',), None),
+    ('insurance_company', '保险公司', ('保险',), None),
+)
+
+# The keywords of insurance company in row mode, the row names are often abbreviation like '国寿', '人保'
+ROW_INSURANCE_KEYWORDS = ('保', '险')
+
+# Company type and Samples property name if no rule matches
+ROW_DEFAULT_TYPE = ('相关机构', 'all')  # 如果判定不了，就全部比较匹配
+SAMPLE_DEFAULT_TYPE = ('相关机构', 'related_institutions')
+
+
+class CompanyTypeClassifier(object):
+    """
+    Classify company name by keywords of COMPANY_TYPE_RULES in one pass, the rule with highest precedence wins.
+    Same as matching the rules one by one with '^.*(keyword)+', so a keyword after a line break doesn't count.
+    """
+
+    def __init__(self, mode='row'):
+        """
+        :param mode: 'row' classifies the company name of rows, 'sample' classifies the full name of Samples
+        """
+        if mode not in ('row', 'sample'):
+            raise ValueError(f'unknown company type mode: {mode}')
+        self.mode = mode
+        self.rules = []  # precedence -> (company type, Samples property name, excluded following word)
+        _keyword_rules = {}  # keyword -> precedence
+        for precedence, (property_name, company_type, keywords, excluded) in enumerate(COMPANY_TYPE_RULES):
+            if mode == 'row' and property_name == 'insurance_company':
+                keywords = ROW_INSURANCE_KEYWORDS
+            self.rules.append((company_type, property_name, excluded))
+            for keyword in keywords:
+                _keyword_rules.setdefault(keyword, precedence)
+        self.keyword_rules = _keyword_rules
+        self.automaton = KeywordAutomaton(_keyword_rules)
+        self.default_type = ROW_DEFAULT_TYPE if mode == 'row' else SAMPLE_DEFAULT_TYPE
+
+    def classify(self, company_name):
+        """
+        :param company_name: company name
+        :return: company type, Samples property name
+        """
+        if not isinstance(company_name, str):
+            return self.default_type
+        _line = company_name.split('\n', 1)[0]
+        _precedence = len(self.rules)
+        for _start, _end, keyword in self.automaton.iter_matches(_line):
+            precedence = self.keyword_rules[keyword]
+            if precedence >= _precedence:
+                continue
+            excluded = self.rules[precedence][2]
+            if excluded and _line.startswith(excluded, _end):
+                continue
+            _precedence = precedence
+            if _precedence == 0:
+                break
+        if _precedence == len(self.rules):
+            return self.default_type
+        return self.rules[_precedence][:2]
+
+    def classify_batch(self, company_names):
+        """
+        :param company_names: list of company names
+        :return: list of (company type, Samples property name)
+        """
+        return [self.classify(company_name) for company_name in company_names]
+
+
+_classifiers = {mode: CompanyTypeClassifier(mode) for mode in ('row', 'sample')}
+
+
+def classify_company_type(company_name, mode='row'):
+    """
+    Get company type of name
+    :param company_name: company name
+    :param mode: 'row' or 'sample'
+    :return: company type, Samples property name
+    """
+    return _classifiers[mode].classify(company_name)
+
+
+def classify_company_type_batch(company_names, mode='row'):
+    """
+    Get company types of a list of names
+    :param company_names: list of company names
+    :param mode: 'row' or 'sample'
+    :return: list of (company type, Samples property name)
+    """
+    return _classifiers[mode].classify_batch(company_names)
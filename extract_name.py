@@ -1,10 +1,87 @@
 import os
 import sys
 import re
+import threading
 import jieba
 from utils.util_xlsx import HandleXLSX
 from utils.util_re import re_remove_sub_company, re_full_company_name
-from settings import PROVINCE, EXCLUDE_WORDS, EXTRACT_WORDS
+from utils.util_automaton import KeywordAutomaton
+from utils.util_jieba import cached_lcut, get_dictionary_fingerprint
+import settings
+from settings import PROVINCE
+
+# Region keywords, compiled once
+PROVINCE_WORDS = frozenset(PROVINCE)
+PROVINCE_AUTOMATON = KeywordAutomaton(PROVINCE)
+# (jieba dictionary fingerprint, automaton of region keywords in the dictionary)
+_province_word_automaton = (None, None)
+_province_word_automaton_lock = threading.Lock()
+
+
+class TrimRulePlan(object):
+    """
+    Keyword lists of trimming rules compiled into one automaton.
+    One pass over the name finds the highest priority word of every rule, the priority is the order in list.
+    """
+
+    def __init__(self, rules):
+        """
+        :param rules: {rule name: list of words in order of priority}
+        """
+        self._plan = None
+        self.build(rules)
+
+    def build(self, rules):
+        """
+        Compile rules, it can be called again when the rules change
+        :param rules: {rule name: list of words in order of priority}
+        :return:
+        """
+        _word_rules = {}  # word -> [(rule name, priority)]
+        for rule_name, words in rules.items():
+            _words = set()
+            for priority, word in enumerate(words):
+                if word and word not in _words:
+                    _words.add(word)
+                    _word_rules.setdefault(word, []).append((rule_name, priority))
+        # Replace automaton and rules at once, so a concurrent search never sees half of them
+        self._plan = (KeywordAutomaton(_word_rules), _word_rules)
+
+    def search(self, text, rule_names):
+        """
+        Get the highest priority word of each rule found in text
+        :param text: text
+        :param rule_names: names of rules to search
+        :return: {rule name: (word, start of first occurrence)}, the rule without any word found is absent
+        """
+        _automaton, _word_rules = self._plan
+        _best = {}  # rule name -> (priority, start, word)
+        for start, _end, word in _automaton.iter_matches(text):
+            for rule_name, priority in _word_rules[word]:
+                if rule_name in rule_names and (rule_name not in _best or (priority, start) < _best[rule_name][:2]):
+                    _best[rule_name] = (priority, start, word)
+        return {rule_name: (word, start) for rule_name, (priority, start, word) in _best.items()}
+
+
+def get_trim_rules():
+    """
+    :return: trimming rules of settings
+    """
+    return {'pre_trim': settings.PRE_TRIM_WORDS, 'extract': settings.EXTRACT_WORDS,
+            'exclude': settings.EXCLUDE_WORDS}
+
+
+# Trimming rules of extract_company_name, compiled once
+TRIM_RULE_PLAN = TrimRulePlan(get_trim_rules())
+
+
+def rebuild_trim_rule_plan(rules=None):
+    """
+    Compile trimming rules again after settings change
+    :param rules: {rule name: list of words}, default is the rules of settings
+    :return:
+    """
+    TRIM_RULE_PLAN.build(rules or get_trim_rules())
 
 
 def extract_company_name(company_name):
@@ -26,81 +103,76 @@ def post_trim_company_name(company_name):
     :return:
     """
     # 注意 EXTRACT_WORDS 中字段有优先顺序，从左到右
-    for _word in EXTRACT_WORDS:
-        if company_name.find(_word) != -1:
-            return _word
-
-    if not re_full_company_name(company_name) or re_remove_sub_company(company_name):
-        for _word in EXCLUDE_WORDS:
-            if company_name.find(_word) != -1:
-                return trim_string(company_name, _word)
+    _found = TRIM_RULE_PLAN.search(company_name, ('extract', 'exclude'))
+    if 'extract' in _found:
+        return _found['extract'][0]
+
+    if 'exclude' in _found and (not re_full_company_name(company_name) or re_remove_sub_company(company_name)):
+        return trim_found_word(company_name, *_found['exclude'])
     return company_name
 
 
 def pre_trim_company_name(company_name):
-    if company_name.find('公司') != -1:
-        pre_company_name = trim_string(company_name, '公司')
-    elif company_name.find('银行') != -1:
-        pre_company_name = trim_string(company_name, '银行')
-    elif company_name.find('集团') != -1:
-        pre_company_name = trim_string(company_name, '集团')
+    """
+    Cut company name after the first word in PRE_TRIM_WORDS, the words are in order of priority
+    :param company_name:
+    :return:
+    """
+    _found = TRIM_RULE_PLAN.search(company_name, ('pre_trim',))
+    if 'pre_trim' in _found:
+        pre_company_name = trim_found_word(company_name, *_found['pre_trim'])
     else:
         pre_company_name = company_name
 
     return pre_company_name
 
 
+def trim_found_word(company_name, word, start):
+    """
+    Same as trim_string(company_name, word), the first occurrence of word is already found
+    :param company_name:
+    :param word: found word
+    :param start: index of the first occurrence of word in company_name
+    :return:
+    """
+    _company_name = str(company_name)
+    return _company_name[:start + len(word)].lstrip()
+
+
 def mid_trim_company_name(company_name):
     """
     Remove sub company name that include '支' or '分'
-    Check keyword in Province by using jieba
-    Recursive get adjacent remove_words that consist of keywords
+    Check keyword in Province by using jieba tokens and region keywords automaton
+    Trim before keywords from right to left, until the name doesn't include sub company
     :param company_name:
     :return:
     """
     if re_remove_sub_company(company_name):
-        # company_name = re.sub(r'(省|自治区|市|县|区|州)', '', company_name)
+        # Without any region keyword after the first 2 characters, nothing can be trimmed
+        if not any(_start >= 2 for _start, _end, _keyword in PROVINCE_AUTOMATON.iter_matches(company_name)):
+            return company_name
 
-        company_name_list = list(jieba.lcut(company_name))
+        company_name_list = list(cached_lcut(company_name))
         company_name_list_len = len(company_name_list)
 
         if company_name_list_len > 1:
+            # The first '支' or '分' that re_remove_sub_company matches, it's sub company while the name is longer
+            _first_line = company_name.split('\n', 1)[0]
+            _sub_company_index = min(idx for idx in (_first_line.find('支', 4), _first_line.find('分', 4))
+                                     if idx != -1)
+            _length = len(company_name)
+
             company_name_list.reverse()
             for idx in range(0, company_name_list_len - 1):
                 _keyword = search_province_word(company_name_list[idx])
                 if _keyword:
-                    company_name = trim_string(company_name, _keyword, start=2, reserve=False)
-                    if re_remove_sub_company(company_name):
-                        continue
-                    else:
-                        return company_name
-
-                # if company_name_list[idx] in PROVINCE:
-                #     # remove_words = recursive_get_keyword(company_name_list, company_name_list_len, idx)
-                #     # mid_company_name = trim_string(company_name, remove_words, start=2, reserve=False)
-                #     company_name = trim_string(company_name, company_name_list[idx], start=2, reserve=False)
-                #     if re_remove_sub_company(company_name):
-                #         continue
-                #     else:
-                #         return company_name
-                # else:
-                #     _keyword = re.sub(r'(省|自治区|市)', '', company_name_list[idx])
-                #     if _keyword in PROVINCE:
-                #         company_name = trim_string(company_name, _keyword, start=2, reserve=False)
-                #         if re_remove_sub_company(company_name):
-                #             continue
-                #         else:
-                #             return company_name
-                #     else:
-                #         _keyword = re.sub(r'(县|区|州)', '', company_name_list[idx])
-                #         if _keyword in PROVINCE:
-                #             company_name = trim_string(company_name, _keyword, start=2, reserve=False)
-                #             if re_remove_sub_company(company_name):
-                #                 continue
-                #             else:
-                #                 return company_name
-
-            return company_name
+                    # Same as trim_string(company_name, _keyword, start=2, reserve=False) on the trimmed name
+                    _index = company_name.find(_keyword, 2, _length)
+                    if _index != -1:
+                        _length = _index
+                    if _length <= _sub_company_index:
+                        break
+            return company_name[:_length]
         else:
             return company_name
     else:
@@ -108,17 +180,39 @@ def mid_trim_company_name(company_name):
 
 
 def search_province_word(key_word):
-    if key_word in PROVINCE:
+    """
+    Get region keyword of jieba token, the token itself or the first word of jieba full mode in PROVINCE
+    :param key_word: jieba token
+    :return: region keyword or None
+    """
+    if key_word in PROVINCE_WORDS:
         return key_word
     elif len(key_word) > 1:
-        for word in list(jieba.lcut(key_word, cut_all=True)):
-            if len(word) > 1:
-                if word in PROVINCE:
-                    return word
+        # Words of jieba full mode are ordered by start then end, so the first one is the leftmost shortest
+        _matches = get_province_word_automaton().find_all(key_word)
+        if _matches:
+            return min(_matches)[2]
     else:
         return
 
 
+def get_province_word_automaton():
+    """
+    Automaton of the region keywords that jieba full mode can cut, the multi-character words in jieba dictionary.
+    It's rebuilt when jieba dictionary changes, e.g. init_jieba loads the prebuilt dictionary after the first use
+    :return: instance of KeywordAutomaton
+    """
+    global _province_word_automaton
+    jieba.dt.check_initialized()
+    _fingerprint = get_dictionary_fingerprint()
+    if _province_word_automaton[0] != _fingerprint:
+        with _province_word_automaton_lock:
+            if _province_word_automaton[0] != _fingerprint:
+                _automaton = KeywordAutomaton(word for word in PROVINCE if len(word) > 1 and jieba.dt.FREQ.get(word))
+                _province_word_automaton = (_fingerprint, _automaton)
+    return _province_word_automaton[1]
+
+
 def recursive_get_keyword(company_name_list, company_name_list_len, idx, keyword=None):
     """
     Recursive search for adjacent keywords that need to be removed
@@ -6,19 +6,29 @@ import sys
 import getopt
 import time
 import re
-import jieba
-import difflib
 from pprint import pprint
-from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, TimeoutError
 from utils.util_logfile import nlogger, flogger, slogger, traceback
-from utils.util_xlsx import HandleXLSX
-from utils.util_re import re_bank, re_like_bank, re_agency_company, re_sale_company, re_appraisal_company, \
-    re_economic_company, re_insurance, re_like_insurance, re_company
+from utils.util_xlsx import HandleXLSX, StreamWorkbookWriter
+from utils.util_xlsx_reader import ProjectedXLSX
+from utils.util_text_reader import get_text_reader_class
+from utils.util_jieba import init_jieba, cached_lcut, get_cache_stats as get_jieba_cache_stats
+from utils.util_re import re_like_bank, re_match_batch
 from datetime import datetime
-from settings import TASK_WAITING_TIME, MAX_WORKERS, SAMPLES_FILE, EXCLUDE_WORDS
-from row_object import RowStatus
+from settings import TASK_WAITING_TIME, MAX_WORKERS, SAMPLES_FILE, EXCLUDE_WORDS, GUESS_MIN_SIMILARITY, MATCH_ENGINE, \
+    MATCH_STORE_FILE, DEDUPE_ROWS, FULL_NAME_LSH, ABBR_EDIT_DISTANCE, EXECUTION_MODE, MAX_PROCESS_WORKERS, \
+    PROCESS_CHUNK_SIZE, SAMPLES_SNAPSHOT_DIR, XLSX_READ_ONLY, XLSX_PROJECTED_READER, RESULT_OUTPUT, \
+    SHEET_CACHE_DIR, RESULT_WRITER
+from row_object import RowStatus, SOURCE_COLUMNS, SAMPLES_COLUMNS
+from result_sidecar import SIDECAR_FORMATS, get_result_values, get_result_sheet_values, write_sidecar
 from extract_name import extract_company_name
 from structure_sample import get_samples_object, Samples
+from samples_snapshot import SamplesSnapshot, SnapshotError
+from sheet_cache import SheetCache, SheetCacheError, CachedXLSX
+from tfidf_match import TfidfMatchEngine
+from company_type import classify_company_type
+from match_cache import MatchMemo, MatchStore, get_company_info, set_company_info
 
 
 class GetURLError(Exception):
@@ -41,34 +51,54 @@ class WriteResultError(Exception):
     pass
 
 
-def exec_func(check_file, file_name=None, sheet_name=None, start_point=None, end_point=None, **kwargs):
+def exec_func(check_file, file_name=None, sheet_name=None, start_point=None, end_point=None, engine=MATCH_ENGINE,
+              dedupe=DEDUPE_ROWS, mode=EXECUTION_MODE, read_only=XLSX_READ_ONLY, output=RESULT_OUTPUT,
+              sheet_cache_dir=SHEET_CACHE_DIR, writer=RESULT_WRITER, **kwargs):
     """
     Executive Function
     :param check_file: if check_file is True,then only check if download file exists. default False
-    :param file_name: Excel file name
+    :param file_name: Excel file name, or CSV/TSV/JSONL file chosen by extension
     :param sheet_name: sheet name, default active sheet
     :param start_point: start row number, minimum is 2 ( row 1 is column name)
     :param end_point: end row number , maximum is the row number of sheet
+    :param engine: similarity match engine, 'difflib' or 'tfidf'
+    :param dedupe: if dedupe is True, handle each distinct '公司' value once and copy result to the rows
+    :param mode: 'thread' handles rows by ThreadPoolExecutor, 'process' by ProcessPoolExecutor
+    :param read_only: if read_only is True, source excel is streamed in read-only mode with constant memory
+    :param output: 'workbook' writes source excel with result columns, 'xlsx', 'csv' or 'jsonl' writes sidecar file
+    :param sheet_cache_dir: directory of sheet cache, source excel sheet is read from its cache. None means no cache
+    :param writer: result workbook writer, 'auto', 'inplace' or 'stream'
     :param kwargs:
     :return:
     """
     try:
+        init_jieba()
         # Construct dictionary of company
         _dict_file_name = check_file_name(SAMPLES_FILE, **kwargs)
         # _dict_file_name = check_file_name('会员单位名单.xlsx', **kwargs)
-        _dict_xls, _dict_row_object_iterator = get_row_object_iterator(check_file, _dict_file_name, 'listing', **kwargs)
-        samples_object = get_samples_object(_dict_row_object_iterator, **kwargs)
+        samples_object = load_samples_object(check_file, _dict_file_name, **kwargs)
         nlogger.info(f"get_samples_object has been completed")
+        kwargs['match_engine'] = get_match_engine(engine, samples_object, **kwargs)
+        kwargs['match_memo'] = MatchMemo()
+        if MATCH_STORE_FILE:
+            kwargs['match_store'] = MatchStore(_dict_file_name, engine)
 
         # Prepare source data
         _data_file_name = check_file_name(file_name, **kwargs)
         _data_xls, _data_row_object_iterator = get_row_object_iterator(check_file, _data_file_name, sheet_name,
-                                                                       start_point, end_point, **kwargs)
-        nlogger.info(f"handle_data_thread start")
-        _data_result = handle_data_thread(row_object_iterator=_data_row_object_iterator, samples_object=samples_object,
-                                          **kwargs)
+                                                                       start_point, end_point, read_only=read_only,
+                                                                       columns=SOURCE_COLUMNS,
+                                                                       cache_dir=sheet_cache_dir, **kwargs)
+        if mode == 'process':
+            nlogger.info(f"handle_data_process start")
+            _data_result = handle_data_process(row_object_iterator=_data_row_object_iterator,
+                                               samples_object=samples_object, dedupe=dedupe, **kwargs)
+        else:
+            nlogger.info(f"handle_data_thread start")
+            _data_result = handle_data_thread(row_object_iterator=_data_row_object_iterator,
+                                              samples_object=samples_object, dedupe=dedupe, **kwargs)
         nlogger.info(f"write_result_to_xls start")
-        write_result_to_xls(_data_xls, _data_result)
+        write_result_to_xls(_data_xls, _data_result, output, writer)
     except (GetRowIterError, HandleDataError, ThreadTaskError, WriteResultError) as e:
         nlogger.error('{fn} Custom error: {e}'.format(fn='exec_func', e=repr(e)))
         print(f'Custom error: {repr(e)}')
@@ -78,6 +108,9 @@ def exec_func(check_file, file_name=None, sheet_name=None, start_point=None, end
     except Exception as e:
         nlogger.error('{fn} error: {e}'.format(fn='exec_func', e=traceback.format_exc()))
         print(f'Undefined error: {repr(e)}')
+    finally:
+        if kwargs.get('match_store') is not None:
+            kwargs['match_store'].close()
 
 
 def check_file_name(file_name, **kwargs):
@@ -93,7 +126,8 @@ def check_file_name(file_name, **kwargs):
     return _file_name
 
 
-def get_row_object_iterator(check_file, file_name, sheet_name=None, start_point=None, end_point=None, **kwargs):
+def get_row_object_iterator(check_file, file_name, sheet_name=None, start_point=None, end_point=None, read_only=False,
+                            columns=None, cache_dir=None, **kwargs):
     """
     get iterator of row object
     :param check_file: True or False
@@ -101,11 +135,20 @@ def get_row_object_iterator(check_file, file_name, sheet_name=None, start_point=
     :param sheet_name:
     :param start_point:
     :param end_point:
+    :param read_only: open Excel in read-only mode and stream rows
+    :param columns: column names that row objects need, read-only Excel only parses them by ProjectedXLSX
+    :param cache_dir: directory of sheet cache, Excel sheet is read from its cache. None means no cache
     :param kwargs:
     :return: instance of HandleXLSX object, iterator of row object
     """
     try:
-        source_xls = HandleXLSX(file_name, sheet_name)
+        # CSV, TSV and JSONL are chosen by file extension, they are always read-only
+        _text_reader_class = get_text_reader_class(file_name)
+        if _text_reader_class is not None:
+            source_xls = _text_reader_class(file_name, sheet_name, columns=columns)
+        else:
+            source_xls = get_xlsx_reader(file_name, sheet_name, read_only=read_only, columns=columns,
+                                         cache_dir=cache_dir)
         row_object_iterator = source_xls.generate_row_object_iterator(check_file, sheet_name, start_point, end_point,
                                                                       **kwargs)
         return source_xls, row_object_iterator
@@ -114,8 +157,130 @@ def get_row_object_iterator(check_file, file_name, sheet_name=None, start_point=
         raise GetRowIterError('{fn} error: {e}'.format(fn='get_row_object_iterator', e=repr(e)))
 
 
-# def handle_data(data_row_object_iterator, company_dict, **kwargs):
-#     return _data_result
+def get_xlsx_reader(file_name, sheet_name=None, read_only=False, columns=None, cache_dir=None):
+    """
+    Open Excel reader. With cache_dir, the requested columns of the sheet are converted into a binary columnar cache
+    on first read, later runs of any row range read the cache and don't parse Excel.
+    :param file_name:
+    :param sheet_name:
+    :param read_only: open Excel in read-only mode and stream rows
+    :param columns: column names that row objects need
+    :param cache_dir: directory of sheet cache, None means no cache
+    :return: instance of HandleXLSX, ProjectedXLSX or CachedXLSX
+    """
+    # Read-only Excel reads the values that Excel calculated, otherwise formulas, they are cached separately
+    _sheet_cache = SheetCache(file_name, sheet_name, data_only=read_only, columns=columns,
+                              cache_dir=cache_dir) if cache_dir else None
+    if _sheet_cache is not None:
+        _start = time.time()
+        _cached_sheet = _sheet_cache.load()
+        if _cached_sheet is not None:
+            nlogger.info(f"Sheet is loaded from {_sheet_cache.cache_file}, {time.time() - _start:.3f}s")
+            return CachedXLSX(file_name, _cached_sheet, columns=columns)
+
+    if read_only and XLSX_PROJECTED_READER:
+        source_xls = ProjectedXLSX(file_name, sheet_name, columns=columns)
+    else:
+        source_xls = HandleXLSX(file_name, sheet_name, read_only=read_only)
+    if _sheet_cache is None:
+        return source_xls
+
+    try:
+        nlogger.info(f"Sheet cache is written to {_sheet_cache.save(source_xls)}")
+    except SheetCacheError as e:
+        # This run reads Excel, the next run converts the sheet again
+        nlogger.warning('{fn} error: {e}'.format(fn='get_xlsx_reader', e=repr(e)))
+        return source_xls
+    _cached_sheet = _sheet_cache.load()
+    if _cached_sheet is None:
+        return source_xls
+    source_xls.close()
+    return CachedXLSX(file_name, _cached_sheet, columns=columns)
+
+
+def load_samples_object(check_file, dict_file_name, **kwargs):
+    """
+    Load Samples from snapshot, or build it from dictionary file and write snapshot
+    :param check_file: True or False
+    :param dict_file_name: dictionary file
+    :param kwargs:
+    :return: instance of class Samples
+    """
+    _snapshot = SamplesSnapshot(dict_file_name) if SAMPLES_SNAPSHOT_DIR else None
+    if _snapshot is not None:
+        _start = time.time()
+        samples_object = _snapshot.load()
+        if samples_object is not None:
+            nlogger.info(f"Samples is loaded from {_snapshot.snapshot_file}, {time.time() - _start:.3f}s")
+            return samples_object
+
+    # The dictionary is never written, it's always streamed
+    _dict_xls, _dict_row_object_iterator = get_row_object_iterator(check_file, dict_file_name, 'listing',
+                                                                   read_only=True, columns=SAMPLES_COLUMNS, **kwargs)
+    samples_object = get_samples_object(_dict_row_object_iterator, **kwargs)
+    if _snapshot is not None:
+        try:
+            nlogger.info(f"Samples snapshot is written to {_snapshot.save(samples_object)}")
+        except SnapshotError as e:
+            # The next run builds Samples again
+            nlogger.warning('{fn} error: {e}'.format(fn='load_samples_object', e=repr(e)))
+    return samples_object
+
+
+def get_match_engine(engine, samples_object, **kwargs):
+    """
+    Get similarity match engine
+    :param engine: 'difflib' compares each row by SequenceMatcher, 'tfidf' matches the whole batch by TF-IDF
+    :param samples_object: instance of class Samples
+    :param kwargs:
+    :return: instance of match engine, or None for difflib
+    """
+    if engine is None or engine == 'difflib':
+        return
+    elif engine == TfidfMatchEngine.name:
+        return TfidfMatchEngine(samples_object)
+    else:
+        raise ValueError(f'match engine {engine} is invalid')
+
+
+def prepare_match_engine(row_object_list, samples_object, match_engine, **kwargs):
+    """
+    Match the company names of all rows that need similarity match in batch
+    :param row_object_list: list of row object
+    :param samples_object: instance of class Samples
+    :param match_engine: instance of batch match engine
+    :param kwargs:
+    :return:
+    """
+    _company_names = set()
+    _match_memo = kwargs.get('match_memo')
+    for row_object in row_object_list:
+        try:
+            _source_company_name = str(row_object.column_value.get('公司')).strip()
+            if _match_memo is None:
+                _company_name = extract_company_name(_source_company_name)
+            else:
+                _company_name = _match_memo.extract_company_name(_source_company_name, extract_company_name)
+            if not _company_name or samples_object.get_record(_company_name) or \
+                    get_cached_company_info(_company_name, **kwargs) is not None:
+                continue
+            _company_names.add(_company_name)
+        except Exception as e:
+            # The row will be reported by handle_data_task
+            nlogger.warning("{fn} position:{p} skipped: {e}".format(fn='prepare_match_engine',
+                                                                   p=row_object.position, e=repr(e)))
+
+    # Banks are matched without similarity
+    _company_names = sorted(_company_names)
+    _property_company_names = {}
+    for _company_name, _bank in zip(_company_names, re_match_batch('like_bank', _company_names)):
+        if not _bank:
+            _property_name = get_samples_property_name(_company_name, **kwargs)
+            _property_company_names.setdefault(_property_name, []).append(_company_name)
+
+    for _property_name, _company_names in _property_company_names.items():
+        match_engine.prepare(_property_name, _company_names)
+    nlogger.info(f'prepare_match_engine completed, {len(_property_company_names)} Samples properties')
 
 
 def handle_data_thread(row_object_iterator, **kwargs):
@@ -128,14 +293,20 @@ def handle_data_thread(row_object_iterator, **kwargs):
     executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
     try:
         data_result = []
-        all_task = [executor.submit(handle_data_task, row_object, **kwargs) for row_object in row_object_iterator]
+        row_object_iterator, row_object_groups = prepare_row_objects(row_object_iterator, **kwargs)
+
+        all_task = {executor.submit(handle_data_task, row_object, **kwargs): index
+                    for index, row_object in enumerate(row_object_iterator)}
 
         # Raise TimeoutError: If the entire result iterator could not be generated before the given timeout.
         for future in as_completed(all_task, timeout=TASK_WAITING_TIME):
             data = future.result()
             if data:
                 data_result.append(data)
+                if row_object_groups is not None:
+                    data_result.extend(fan_out_row_object(data, row_object_groups[all_task[future]][1:]))
         nlogger.info(f'Handle data completed, {len(data_result)} rows')
+        complete_handle_data(**kwargs)
         return data_result
     except TimeoutError as e:
         nlogger.error("{fn} TimeoutError: {e}".format(fn='handle_data_thread', e=repr(e)))
@@ -147,6 +318,251 @@ def handle_data_thread(row_object_iterator, **kwargs):
         raise ThreadTaskError('{fn} error: {e}'.format(fn='handle_data_thread', e=repr(e)))
 
 
+def handle_data_process(row_object_iterator, **kwargs):
+    """
+    handle data by multi Process, rows are sent to workers in chunks.
+    Samples and match engine are loaded once per worker by the pool initializer, they are inherited
+    copy-on-write when the platform forks and pickled once per worker otherwise.
+    :param row_object_iterator:
+    :param kwargs:
+    :return: list of row object
+    """
+    executor = None
+    try:
+        data_result = []
+        row_object_iterator, row_object_groups = prepare_row_objects(row_object_iterator, **kwargs)
+        row_object_list = list(row_object_iterator)
+
+        # A forked worker must not inherit a live SQLite connection, the store is connected again after workers start
+        _match_store = kwargs.get('match_store')
+        if _match_store is not None:
+            _match_store.disconnect()
+
+        # Workers are created after the batch match engine is prepared, so they get the prepared results
+        _mp_context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() \
+            else None
+        executor = ProcessPoolExecutor(max_workers=MAX_PROCESS_WORKERS, mp_context=_mp_context,
+                                       initializer=init_worker_process, initargs=(get_worker_kwargs(**kwargs),))
+
+        all_task = {executor.submit(handle_data_chunk, row_object_list[start:start + PROCESS_CHUNK_SIZE]): start
+                    for start in range(0, len(row_object_list), PROCESS_CHUNK_SIZE)}
+        if _match_store is not None:
+            _match_store.connect()
+
+        # Raise TimeoutError: If the entire result iterator could not be generated before the given timeout.
+        _worker_counters = {}
+        for future in as_completed(all_task, timeout=TASK_WAITING_TIME):
+            _chunk_result, _chunk_counters = future.result()
+            add_worker_counters(_worker_counters, _chunk_counters)
+            for index, data in enumerate(_chunk_result, start=all_task[future]):
+                if data:
+                    data_result.append(data)
+                    store_company_info(data, **kwargs)
+                    if row_object_groups is not None:
+                        data_result.extend(fan_out_row_object(data, row_object_groups[index][1:]))
+        nlogger.info(f'Handle data completed, {len(data_result)} rows')
+        complete_handle_data(worker_counters=_worker_counters, **kwargs)
+        executor.shutdown(wait=True)
+        return data_result
+    except TimeoutError as e:
+        nlogger.error("{fn} TimeoutError: {e}".format(fn='handle_data_process', e=repr(e)))
+        executor.shutdown(wait=True)
+        raise ThreadTaskError('{fn} TimeoutError: {e}'.format(fn='handle_data_process', e=repr(e)))
+    except Exception as e:
+        nlogger.error("{fn} error: {e}".format(fn='handle_data_process', e=traceback.format_exc()))
+        flogger.error("{fn} error: {e}".format(fn='handle_data_process', e=repr(e)))
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise ThreadTaskError('{fn} error: {e}'.format(fn='handle_data_process', e=repr(e)))
+
+
+# kwargs of handle_data_task in worker process, set by init_worker_process
+_worker_kwargs = {}
+
+
+def get_worker_kwargs(**kwargs):
+    """
+    Get kwargs that are shipped to worker process
+    :param kwargs:
+    :return:
+    """
+    _kwargs = dict(kwargs)
+    # Each worker has its own memo, the persistent store is written by main process only
+    _kwargs.pop('match_memo', None)
+    return _kwargs
+
+
+def init_worker_process(worker_kwargs):
+    """
+    Initializer of worker process
+    :param worker_kwargs: kwargs of handle_data_task, include samples_object
+    :return:
+    """
+    global _worker_kwargs
+    # A spawned worker starts with jieba default dictionary, Samples token ids are built by the configured one
+    init_jieba()
+    _worker_kwargs = dict(worker_kwargs)
+    _worker_kwargs['match_memo'] = MatchMemo()
+    if _worker_kwargs.get('match_store') is not None:
+        _worker_kwargs['match_store'] = _worker_kwargs['match_store'].reopen(read_only=True)
+
+
+def handle_data_chunk(row_objects):
+    """
+    handle a chunk of rows in worker process
+    :param row_objects: list of row object
+    :return: list of row object processed by handle_data_task, counters of the caches in worker for the chunk
+    """
+    _counters = get_worker_counters(**_worker_kwargs)
+    _result = [handle_data_task(row_object, **_worker_kwargs) for row_object in row_objects]
+    _chunk_counters = get_worker_counters(**_worker_kwargs)
+    for name, counter in _chunk_counters.items():
+        for key in counter:
+            counter[key] -= _counters.get(name, {}).get(key, 0)
+    return _result, _chunk_counters
+
+
+def get_worker_counters(match_memo=None, match_store=None, samples_object=None, **kwargs):
+    """
+    Hit and miss counters of the caches and MinHash LSH counters in worker process, they keep growing in the worker
+    :param match_memo: instance of MatchMemo
+    :param match_store: instance of MatchStore
+    :param samples_object: instance of Samples
+    :param kwargs:
+    :return: {name: {counter: number}}
+    """
+    _stats = {'jieba segmentation cache': get_jieba_cache_stats()}
+    if match_memo is not None:
+        _memo_stats = match_memo.stats()
+        _stats['match memo extract'] = _memo_stats['extract']
+        _stats['match memo match'] = _memo_stats['match']
+    if match_store is not None:
+        _stats['match store'] = match_store.stats()
+    _counters = {name: {'hits': stats['hits'], 'misses': stats['misses']} for name, stats in _stats.items()}
+    if FULL_NAME_LSH and samples_object is not None:
+        for property_name, stats in samples_object.get_lsh_stats().items():
+            _counters[f'MinHash LSH {property_name}'] = {key: stats[key]
+                                                         for key in ('queries', 'candidates', 'no_collision')}
+    return _counters
+
+
+def add_worker_counters(counters, chunk_counters):
+    """
+    Sum the counters of chunks
+    :param counters: {name: {counter: number}}, summed counters
+    :param chunk_counters: {name: {counter: number}} of a chunk
+    :return:
+    """
+    for name, chunk_counter in chunk_counters.items():
+        _counter = counters.setdefault(name, {})
+        for key, number in chunk_counter.items():
+            _counter[key] = _counter.get(key, 0) + number
+
+
+def store_company_info(row_object, match_store=None, **kwargs):
+    """
+    Keep match result of row object that is handled by worker process in persistent store
+    :param row_object: row object processed by handle_data_task
+    :param match_store: instance of MatchStore
+    :param kwargs:
+    :return:
+    """
+    if match_store is not None and row_object.status in (RowStatus.EXISTENCE.value, RowStatus.NONEXISTENCE.value,
+                                                         RowStatus.SIMILARITY.value):
+        match_store.set_company_info(row_object.column_value.get('company_name'), get_company_info(row_object))
+
+
+def prepare_row_objects(row_object_iterator, **kwargs):
+    """
+    Group rows if dedupe, and match all rows in batch if match engine is used
+    :param row_object_iterator: iterator of row object
+    :param kwargs:
+    :return: row objects to handle, row object groups or None
+    """
+    row_object_groups = None
+    if kwargs.get('dedupe'):
+        # Only the first row of each group is handled, the result is copied to other rows in the group
+        row_object_groups = group_row_objects(row_object_iterator, **kwargs)
+        row_object_iterator = [row_objects[0] for row_objects in row_object_groups]
+
+    if kwargs.get('match_engine') is not None:
+        row_object_iterator = list(row_object_iterator)
+        prepare_match_engine(row_object_iterator, **kwargs)
+
+    return row_object_iterator, row_object_groups
+
+
+def complete_handle_data(worker_counters=None, **kwargs):
+    """
+    Log statistics and write persistent store after all rows are handled
+    :param worker_counters: summed counters of worker processes, the caches of main process aren't used then
+    :param kwargs:
+    :return:
+    """
+    if worker_counters is not None:
+        for name, counter in worker_counters.items():
+            if 'hits' in counter:
+                _total = counter['hits'] + counter['misses']
+                counter['hit_rate'] = round(counter['hits'] / _total, 4) if _total else 0
+            nlogger.info(f"{name} stats of workers: {counter}")
+    else:
+        if kwargs.get('match_memo') is not None:
+            nlogger.info(f"Match memo stats: {kwargs['match_memo'].stats()}")
+        nlogger.info(f"jieba segmentation cache stats: {get_jieba_cache_stats()}")
+        if FULL_NAME_LSH and kwargs.get('samples_object') is not None:
+            nlogger.info(f"MinHash LSH stats: {kwargs['samples_object'].get_lsh_stats()}")
+    if kwargs.get('match_store') is not None:
+        _flush_number = kwargs['match_store'].flush()
+        if worker_counters is None:
+            nlogger.info(f"Match store stats: {kwargs['match_store'].stats()}, {_flush_number} results are written")
+        else:
+            nlogger.info(f"Match store: {_flush_number} results are written")
+
+
+def get_normalized_company_name(row_object, **kwargs):
+    """
+    Normalize '公司' value of row object, the rows with same normalized value get same result
+    :param row_object: row object
+    :param kwargs:
+    :return: normalized '公司' value
+    """
+    if isinstance(row_object.column_value, dict):
+        return str(row_object.column_value.get('公司')).strip().replace(" ", "")
+
+
+def group_row_objects(row_object_iterator, **kwargs):
+    """
+    Group row objects by normalized '公司' value
+    :param row_object_iterator: iterator of row object
+    :param kwargs:
+    :return: list of row object groups, in order of the first row of each group
+    """
+    _row_object_groups = {}
+    _row_number = 0
+    for row_object in row_object_iterator:
+        _row_number += 1
+        _company_name = get_normalized_company_name(row_object, **kwargs)
+        if _company_name is None:
+            _row_object_groups[('position', row_object.position)] = [row_object]
+        else:
+            _row_object_groups.setdefault(_company_name, []).append(row_object)
+    nlogger.info(f'group_row_objects completed, {len(_row_object_groups)} distinct company names in {_row_number} rows')
+    return list(_row_object_groups.values())
+
+
+def fan_out_row_object(source_row_object, row_objects):
+    """
+    Copy the result of handled row object to other rows in the same group
+    :param source_row_object: handled row object
+    :param row_objects: other row objects in the group
+    :return: row objects with result
+    """
+    _company_info = get_company_info(source_row_object)
+    for row_object in row_objects:
+        set_company_info(row_object, _company_info)
+    return row_objects
+
+
 def handle_data_task(row_object, **kwargs):
     """
     handle task
@@ -225,11 +641,20 @@ def handle_data(row_object, **kwargs):
     try:
         # kwargs['company_name'] = str(row_object.column_value.get('公司')).strip()
         _source_company_name = str(row_object.column_value.get('公司')).strip()
-        kwargs['company_name'] = extract_company_name(_source_company_name)
+        _match_memo = kwargs.get('match_memo')
+        if _match_memo is None:
+            kwargs['company_name'] = extract_company_name(_source_company_name)
+        else:
+            kwargs['company_name'] = _match_memo.extract_company_name(_source_company_name, extract_company_name)
         assert kwargs.get('company_name'), "company name is invalid"
         assert kwargs.get('samples_object'), "company dict is invalid"
 
+        _company_info = get_cached_company_info(**kwargs)
+        if _company_info is not None:
+            return set_company_info(row_object, _company_info)
+
         _row_object = set_row_object_company_info(row_object, **kwargs)
+        cache_company_info(get_company_info(_row_object), **kwargs)
 
         return _row_object
     except AssertionError:
@@ -239,6 +664,39 @@ def handle_data(row_object, **kwargs):
         raise HandleDataError("{fn} error: {e}".format(fn='handle_data', e=repr(e)))
 
 
+def get_cached_company_info(company_name, match_memo=None, match_store=None, **kwargs):
+    """
+    Get match result of company name from run-scoped memo, then persistent store
+    :param company_name: extracted company name
+    :param match_memo: instance of MatchMemo
+    :param match_store: instance of MatchStore
+    :param kwargs:
+    :return: dict of match result and status, or None
+    """
+    _company_info = match_memo.get_company_info(company_name) if match_memo is not None else None
+    if _company_info is None and match_store is not None:
+        _company_info = match_store.get_company_info(company_name)
+        if _company_info is not None and match_memo is not None:
+            match_memo.set_company_info(company_name, _company_info)
+    return _company_info
+
+
+def cache_company_info(company_info, company_name, match_memo=None, match_store=None, **kwargs):
+    """
+    Keep match result of company name in run-scoped memo and persistent store
+    :param company_info: dict of match result and status
+    :param company_name: extracted company name
+    :param match_memo: instance of MatchMemo
+    :param match_store: instance of MatchStore
+    :param kwargs:
+    :return:
+    """
+    if match_memo is not None:
+        match_memo.set_company_info(company_name, company_info)
+    if match_store is not None:
+        match_store.set_company_info(company_name, company_info)
+
+
 def set_row_object_company_info(row_object, samples_object, company_name, **kwargs):
     """
     add row object property that include company name and company type
@@ -280,8 +738,8 @@ def set_row_object_company_info(row_object, samples_object, company_name, **kwar
         row_object.status = RowStatus.NONEXISTENCE.value
     else:
         similarity_result, similarity_company_name = similarity_match_company_name(samples_object, company_name,
-                                                                                   **kwargs)
-        if similarity_result <= 0.5:
+                                                                                   GUESS_MIN_SIMILARITY, **kwargs)
+        if similarity_result <= GUESS_MIN_SIMILARITY:
             row_object.column_value['result'] = f'未知单位'
             row_object.column_value['company_name'] = company_name
             row_object.column_value['guess_name'] = ''
@@ -290,7 +748,7 @@ def set_row_object_company_info(row_object, samples_object, company_name, **kwar
             row_object.column_value['similarity'] = ''
             row_object.status = RowStatus.NONEXISTENCE.value
         else:
-            _company_info = samples_object.recursive_search_key_value('all_name', similarity_company_name)
+            _company_info = samples_object.get_record(similarity_company_name)
             # print("***" * 30)
             # print(f"{row_object.position} company_name: {company_name}, _company_info: {_company_info}")
             # print("***" * 30)
@@ -311,7 +769,7 @@ def set_row_object_company_info(row_object, samples_object, company_name, **kwar
             elif similarity_result >= 0.8:
                 row_object.column_value['result'] = f'相似单位'
 
-            elif similarity_result > 0.5:
+            elif similarity_result > GUESS_MIN_SIMILARITY:
                 row_object.column_value['result'] = f'猜测单位'
 
     return row_object
@@ -340,6 +798,18 @@ def get_full_or_abbr_property(company_name, length=12, **kwargs):
     return str(_full_or_abbr).strip()
 
 
+def get_samples_property_name(company_name, **kwargs):
+    """
+    structure samples property name that company name compares with
+    :param company_name:
+    :param kwargs:
+    :return: full name or abbreviation property name
+    """
+    _samples_property_name = get_company_name_search_type(company_name, **kwargs)
+    _full_or_abbr = get_full_or_abbr_property(company_name, **kwargs)
+    return f"{_samples_property_name}_{_full_or_abbr}_name"
+
+
 def get_samples_property(samples_object, samples_property_name, full_or_abbr, **kwargs):
     """
     structure samples property name and get property(dict)
@@ -353,31 +823,58 @@ def get_samples_property(samples_object, samples_property_name, full_or_abbr, **
     return samples_object.get_property(_property_name)
 
 
-def similarity_match_company_name(samples_object, company_name, **kwargs):
-    similarity_result = 0
-    similarity_company_name = None
+def get_samples_index(samples_object, samples_property_name, full_or_abbr, **kwargs):
+    """
+    structure samples property name and get n-gram index of property
+    :param samples_object:
+    :param samples_property_name:
+    :param full_or_abbr:
+    :param kwargs:
+    :return: instance of NGramIndex
+    """
+    _property_name = f"{samples_property_name}_{full_or_abbr}_name"
+    return samples_object.get_index(_property_name)
+
+
+def similarity_match_company_name(samples_object, company_name, min_score=0, **kwargs):
+    """
+    Search the most similar name in Samples property, only score candidates blocked by n-gram index
+    :param samples_object: instance of class Samples
+    :param company_name: company name
+    :param min_score: the minimum useful similarity, names that can't exceed it are skipped
+    :param kwargs:
+    :return: similarity, the most similar name; or 0, None if no similarity is greater than min_score
+    """
     _company_name = str(company_name).strip()
 
+    match_engine = kwargs.get('match_engine')
+    if match_engine is not None:
+        return match_engine.search(get_samples_property_name(_company_name, **kwargs), _company_name, min_score)
+
     _samples_property_name = get_company_name_search_type(_company_name, **kwargs)
     _full_or_abbr = get_full_or_abbr_property(_company_name, **kwargs)
-    _samples_company_name_dict = get_samples_property(samples_object, _samples_property_name, _full_or_abbr, **kwargs)
+    _samples_index = get_samples_index(samples_object, _samples_property_name, _full_or_abbr, **kwargs)
 
     # _company_name = filter_company_name(company_name)   ?????
 
     if _full_or_abbr == 'full':
-        _company_name_list = jieba.lcut(_company_name)
-        for samples_company_name in _samples_company_name_dict.keys():
-            _samples_company_name_list = jieba.lcut(samples_company_name)
-            similarity_rate = difflib.SequenceMatcher(None, _company_name_list, _samples_company_name_list).ratio()
-            if similarity_rate > similarity_result:
-                similarity_result = similarity_rate
-                similarity_company_name = samples_company_name
+        _company_name_list = samples_object.encode_tokens(cached_lcut(_company_name))
+        _positions = None
+        if FULL_NAME_LSH:
+            # Only re-score the names colliding in LSH buckets, search all if nothing collides
+            _lsh_index = samples_object.get_lsh_index(f"{_samples_property_name}_{_full_or_abbr}_name")
+            _positions = _lsh_index.get_candidates(_company_name_list) or None
+        similarity_result, similarity_company_name = _samples_index.search(_company_name_list, min_score,
+                                                                           _positions)
     else:
-        for samples_company_name in _samples_company_name_dict.keys():
-            similarity_rate = difflib.SequenceMatcher(None, _company_name, samples_company_name).ratio()
-            if similarity_rate > similarity_result:
-                similarity_result = similarity_rate
-                similarity_company_name = samples_company_name
+        _priority_positions = None
+        if ABBR_EDIT_DISTANCE:
+            # The abbreviations within small edit distance are scored first, so the bounds skip most of others
+            _symmetric_delete_index = samples_object.get_symmetric_delete_index(
+                f"{_samples_property_name}_{_full_or_abbr}_name")
+            _priority_positions = _symmetric_delete_index.lookup(_company_name)
+        similarity_result, similarity_company_name = _samples_index.search(_company_name, min_score,
+                                                                           priority_positions=_priority_positions)
 
     return similarity_result, similarity_company_name
 
@@ -405,29 +902,7 @@ def match_company_type(company_name, **kwargs):
     :param kwargs:
     :return: company type, Samples property name
     """
-    if re_like_bank(company_name):
-        _company_type = "银行"
-        _samples_property_name = 'bank'
-    elif re_appraisal_company(company_name):
-        _company_type = "公估公司"
-        _samples_property_name = 'insurance_appraisal'
-    elif re_economic_company(company_name):
-        _company_type = "经纪公司"
-        _samples_property_name = 'insurance_economic'
-    elif re_agency_company(company_name):
-        _company_type = "代理公司"
-        _samples_property_name = 'insurance_agency'
-    elif re_sale_company(company_name):
-        _company_type = "代理公司"
-        _samples_property_name = 'insurance_sale'
-    elif re_like_insurance(company_name):
-        _company_type = "保险公司"
-        _samples_property_name = 'insurance_company'
-    else:
-        _company_type = "相关机构"
-        _samples_property_name = 'all'  # 如果上述判定不了，就全部比较匹配
-
-    return str(_company_type).strip(), str(_samples_property_name).strip()
+    return classify_company_type(company_name, mode='row')
 
 
 def recursive_get_index(query_list, query_value):
@@ -444,80 +919,61 @@ def recursive_get_index(query_list, query_value):
         return recursive_get_index(query_list, query_value)
 
 
-def write_result_to_xls(source_xls, data_result):
+def write_result_to_xls(source_xls, data_result, output=RESULT_OUTPUT, writer=RESULT_WRITER):
     """
-    Write result in sheet of Excel
+    Write result in sheet of Excel, or in sidecar file.
     :param source_xls:
     :param data_result:
-    :return:
+    :param output: 'workbook' writes a copy of source Excel with result columns,
+        'xlsx', 'csv' or 'jsonl' writes only the result columns keyed by row position, merged by merge_result.py
+    :param writer: 'inplace' writes result columns into the fully loaded source workbook and keeps its formats,
+        'stream' merges result values into source rows streamed into a write-only workbook, values only,
+        'auto' is 'inplace' if source Excel is loaded in full mode
+    :return: output file name
     """
     try:
-        column_name_list = source_xls.get_column_name_list()
-        columns_number = len(column_name_list)
-
-        y_result = recursive_get_index(column_name_list, 'result') + 1
-        if y_result > columns_number:
-            source_xls.write_sheet_rows_value(sheet_name=source_xls.sheet.title, values=(1, y_result, 'result'))
-
-        y_name = recursive_get_index(column_name_list, 'name') + 1
-        if y_name > columns_number:
-            source_xls.write_sheet_rows_value(sheet_name=source_xls.sheet.title, values=(1, y_name, 'name'))
-
-        y_guess_name = recursive_get_index(column_name_list, 'guess_name') + 1
-        if y_guess_name > columns_number:
-            source_xls.write_sheet_rows_value(sheet_name=source_xls.sheet.title, values=(1, y_guess_name, 'guess_name'))
-
-        y_full_name = recursive_get_index(column_name_list, 'full_name') + 1
-        if y_full_name > columns_number:
-            source_xls.write_sheet_rows_value(sheet_name=source_xls.sheet.title, values=(1, y_full_name, 'full_name'))
-
-        y_type = recursive_get_index(column_name_list, 'type') + 1
-        if y_type > columns_number:
-            source_xls.write_sheet_rows_value(sheet_name=source_xls.sheet.title, values=(1, y_type, 'type'))
-
-        y_similarity = recursive_get_index(column_name_list, 'similarity') + 1
-        if y_similarity > columns_number:
-            source_xls.write_sheet_rows_value(sheet_name=source_xls.sheet.title, values=(1, y_similarity, 'similarity'))
-
-        for row_object in data_result:
-            x = row_object.position
-            y = y_result
-            values = (x, y, row_object.column_value.get('result', 'unknown'))
-            source_xls.write_sheet_rows_value(sheet_name=row_object.sheet_name, values=values)
-
-            if row_object.column_value.get('company_name'):
-                y = y_name
-                values = (x, y, row_object.column_value.get('company_name'))
-                source_xls.write_sheet_rows_value(sheet_name=row_object.sheet_name, values=values)
-
-            if row_object.column_value.get('guess_name'):
-                y = y_guess_name
-                values = (x, y, row_object.column_value.get('guess_name'))
-                source_xls.write_sheet_rows_value(sheet_name=row_object.sheet_name, values=values)
-
-            if row_object.column_value.get('company_full_name'):
-                y = y_full_name
-                values = (x, y, row_object.column_value.get('company_full_name'))
-                source_xls.write_sheet_rows_value(sheet_name=row_object.sheet_name, values=values)
-
-            if row_object.column_value.get('company_type'):
-                y = y_type
-                values = (x, y, row_object.column_value.get('company_type'))
-                source_xls.write_sheet_rows_value(sheet_name=row_object.sheet_name, values=values)
-
-            if row_object.column_value.get('similarity'):
-                y = y_similarity
-                values = (x, y, row_object.column_value.get('similarity'))
-                source_xls.write_sheet_rows_value(sheet_name=row_object.sheet_name, values=values)
-
-        _result_file_name = "result_{d}.xlsx".format(d=datetime.now().strftime('%Y%m%d-%H:%M:%S'))
-        source_xls.save(_result_file_name)
-        nlogger.info(f'Write result completed, output file: {_result_file_name}')
+        _date = datetime.now().strftime('%Y%m%d-%H:%M:%S')
+        if output in SIDECAR_FORMATS:
+            _result_file_name = f"result_{_date}.{output}"
+            _rows_number = write_sidecar(_result_file_name, data_result)
+            nlogger.info(f'Write result completed, output sidecar file: {_result_file_name}, {_rows_number} rows')
+            return _result_file_name
+
+        _results = [(row_object.position, get_result_values(row_object)) for row_object in data_result]
+        _sheet_values = {source_xls.sheet.title: get_result_sheet_values(source_xls.get_column_name_list(), _results)}
+
+        _result_file_name = f"result_{_date}.xlsx"
+        _writer = get_result_writer(source_xls, writer)
+        if _writer == 'inplace':
+            # Source loaded in read-only mode or from sheet cache is loaded again in full mode
+            _work_book_xls = source_xls if not source_xls.read_only else HandleXLSX(source_xls.file_name)
+            _work_book_xls.write_sheet_values(_sheet_values)
+            _work_book_xls.save(_result_file_name)
+        else:
+            StreamWorkbookWriter(source_xls.file_name, source_xls.open_workbook).save(_result_file_name, _sheet_values)
+        nlogger.info(f'Write result completed, writer: {_writer}, output file: {_result_file_name}')
+        return _result_file_name
     except Exception as e:
         nlogger.error("{fn} error: {e}".format(fn='write_result_to_xls', e=traceback.format_exc()))
         raise WriteResultError("{fn} error: {e}".format(fn='write_result_to_xls', e=repr(e)))
 
 
+def get_result_writer(source_xls, writer=RESULT_WRITER):
+    """
+    Choose the writer of result workbook
+    :param source_xls: reader of source file
+    :param writer: 'auto', 'inplace' or 'stream'
+    :return: 'inplace' or 'stream'
+    """
+    if get_text_reader_class(source_xls.file_name) is not None:
+        if writer == 'inplace':
+            nlogger.warning(f'Text source {source_xls.file_name} is not a workbook, result is written by stream writer')
+        return 'stream'
+    if writer == 'auto':
+        return 'stream' if source_xls.read_only else 'inplace'
+    return writer
+
+
 def usage():
     """
     Command help
@@ -526,18 +982,29 @@ def usage():
     info = \
         """
 Usage:
-    python3.9 handle.py -file [ -sheet -start -end ]
+    python3.9 handle.py -file [ -sheet -start -end -engine -dedupe -worker -read-only -output -sheet-cache -writer ]
     Help:
      -h --help
      -c --check   <check whether download file exists and do nothing>   
      
     Mandatory options:
-     -f --file    <source excel>
+     -f --file    <source excel, or csv/tsv/jsonl file whose first row (first object keys) is column names>
     
     Optional options:
      -t --sheet   <The sheet name in Excel, default active sheet in Excel>
      -s --start   <Excel start row. Must be int,default index 2>
      -e --end     <Excel end row. Must be int,default Maximum number of rows in Excel>
+     -m --engine  <Similarity match engine, difflib or tfidf. default MATCH_ENGINE in settings>
+     -d --dedupe  <Handle each distinct company name once and copy the result to its rows>
+     -w --worker  <Execution mode, thread or process. default EXECUTION_MODE in settings>
+     -r --read-only  <Stream source excel in read-only mode with constant memory>
+     -o --output  <Result output, workbook or sidecar file format xlsx, csv, jsonl. default RESULT_OUTPUT in settings.
+                   workbook is written by the writer of -W --writer>
+     -k --sheet-cache  <Directory of sheet cache, '公司' column of source excel is cached on first read and later runs
+                        of any row range read the cache. default SHEET_CACHE_DIR in settings>
+     -W --writer  <Result workbook writer, auto, inplace or stream. default RESULT_WRITER in settings.
+                   inplace keeps styles and formats of source excel, stream keeps values and formulas with flat memory,
+                   auto is inplace if source excel is loaded in full mode>
         """
     print(info)
 
@@ -553,13 +1020,28 @@ def main(argv):
     _sheet_name = None
     _start_point = None
     _end_point = None
+    _engine = MATCH_ENGINE
+    _dedupe = DEDUPE_ROWS
+    _mode = EXECUTION_MODE
+    _read_only = XLSX_READ_ONLY
+    _output = RESULT_OUTPUT
+    _sheet_cache_dir = SHEET_CACHE_DIR
+    _writer = RESULT_WRITER
 
     try:
-        opts, args = getopt.getopt(argv, "hcf:t:s:e:", ["help", "file", "sheet", "start", "end"])  # 短选项和长选型模式
+        opts, args = getopt.getopt(argv, "hcf:t:s:e:m:dw:ro:k:W:", ["help", "check", "file=", "sheet=", "start=",
+                                                                    "end=", "engine=", "dedupe", "worker=",
+                                                                    "read-only", "output=", "sheet-cache=",
+                                                                    "writer="])  # 短选项和长选型模式
     except getopt.GetoptError:
         print("Usage 1: python3.9 handle.py -h -c -f <source excel>  -t <excel sheet>  -s <start row index>  "
-              "-e <end row index> \nUsage 2: python3.9 handle.py --help --check --file <source excel>  "
-              "--sheet <excel sheet> --start <start row index>  --end <end row index>")
+              "-e <end row index>  -m <match engine>  -d  -w <thread or process>  -r  -o <output>  "
+              "-k <sheet cache directory>  -W <writer> \nUsage 2: python3.9 handle.py --help --check "
+              "--file <source excel>  "
+              "--sheet <excel sheet> "
+              "--start <start row index>  --end <end row index>  --engine <match engine>  --dedupe  "
+              "--worker <thread or process>  --read-only  --output <output>  "
+              "--sheet-cache <sheet cache directory>  --writer <writer>")
         sys.exit(2)  # 2 Incorrect Usage
 
     for opt, arg in opts:
@@ -576,6 +1058,20 @@ def main(argv):
             _start_point = str(arg).strip()
         elif opt in ('-e', '--end'):
             _end_point = str(arg).strip()
+        elif opt in ('-m', '--engine'):
+            _engine = str(arg).strip()
+        elif opt in ('-d', '--dedupe'):
+            _dedupe = True
+        elif opt in ('-w', '--worker'):
+            _mode = str(arg).strip()
+        elif opt in ('-r', '--read-only'):
+            _read_only = True
+        elif opt in ('-o', '--output'):
+            _output = str(arg).strip()
+        elif opt in ('-k', '--sheet-cache'):
+            _sheet_cache_dir = str(arg).strip()
+        elif opt in ('-W', '--writer'):
+            _writer = str(arg).strip()
 
     if _file_name is None:
         print("Invalid parameter, -f --file must be provided. \nTry '-h --help' for more information.")
@@ -589,8 +1085,27 @@ def main(argv):
         print("Invalid parameter, -e --end must be followed by integer. \nTry '-h --help' for more information.")
         sys.exit(2)
 
+    if _engine not in ('difflib', 'tfidf'):
+        print("Invalid parameter, -m --engine must be difflib or tfidf. \nTry '-h --help' for more information.")
+        sys.exit(2)
+
+    if _mode not in ('thread', 'process'):
+        print("Invalid parameter, -w --worker must be thread or process. \nTry '-h --help' for more information.")
+        sys.exit(2)
+
+    if _output not in ('workbook',) + SIDECAR_FORMATS:
+        print("Invalid parameter, -o --output must be workbook, xlsx, csv or jsonl. \nTry '-h --help' for more "
+              "information.")
+        sys.exit(2)
+
+    if _writer not in ('auto', 'inplace', 'stream'):
+        print("Invalid parameter, -W --writer must be auto, inplace or stream. \nTry '-h --help' for more "
+              "information.")
+        sys.exit(2)
+
     params = dict(check_file=_check_file, file_name=_file_name, sheet_name=_sheet_name, start_point=_start_point,
-                  end_point=_end_point)
+                  end_point=_end_point, engine=_engine, dedupe=_dedupe, mode=_mode, read_only=_read_only,
+                  output=_output, sheet_cache_dir=_sheet_cache_dir, writer=_writer)
 
     exec_func(**params)
 
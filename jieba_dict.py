@@ -0,0 +1,142 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Build jieba dictionary with the vocabulary of company names, and serialize its prefix dictionary model.
+The dictionary is jieba default dictionary plus the words of PROVINCE and Samples abbreviations,
+handle.py loads it at startup by init_jieba.
+
+python3.9 jieba_dict.py
+"""
+
+import os
+import sys
+import time
+import getopt
+import jieba
+from utils.util_xlsx import HandleXLSX
+from utils.util_xlsx_reader import ProjectedXLSX
+from utils.util_text_reader import get_text_reader_class
+from utils.util_logfile import nlogger, traceback
+from utils.util_jieba import init_jieba
+from settings import PROVINCE, SAMPLES_FILE, JIEBA_DICT_FILE, JIEBA_CACHE_FILE, XLSX_PROJECTED_READER
+
+# Part of speech tag of added words
+REGION_TAG = 'ns'
+COMPANY_TAG = 'nt'
+
+
+class BuildDictError(Exception):
+    pass
+
+
+def get_samples_vocabulary(samples_file=SAMPLES_FILE, sheet_name='listing'):
+    """
+    Get abbreviations in dictionary file.
+    Full names are not added, they are compared by jieba tokens and must be cut into several tokens.
+    :param samples_file: dictionary file
+    :param sheet_name: sheet name
+    :return: list of abbreviations
+    """
+    _text_reader_class = get_text_reader_class(samples_file)
+    if _text_reader_class is not None:
+        _xls = _text_reader_class(samples_file, sheet_name, columns=['简称'])
+    elif XLSX_PROJECTED_READER:
+        _xls = ProjectedXLSX(samples_file, sheet_name, columns=['简称'])
+    else:
+        _xls = HandleXLSX(samples_file, sheet_name)
+    _words = []
+    for row_object in _xls.generate_row_object_iterator(False, sheet_name):
+        _abbr_name = str(row_object.column_value.get('简称')).strip()
+        if _abbr_name and _abbr_name != 'None':
+            _words.append(_abbr_name)
+    return _words
+
+
+def get_vocabulary(samples_file=SAMPLES_FILE):
+    """
+    :param samples_file: dictionary file
+    :return: {word: tag}
+    """
+    _vocabulary = {}
+    for word in PROVINCE:
+        if len(word) > 1:
+            _vocabulary.setdefault(word, REGION_TAG)
+    for word in get_samples_vocabulary(samples_file):
+        if len(word) > 1 and not any(char.isspace() for char in word):
+            _vocabulary.setdefault(word, COMPANY_TAG)
+    return _vocabulary
+
+
+def build_jieba_dict(samples_file=SAMPLES_FILE, dict_file=JIEBA_DICT_FILE, cache_file=JIEBA_CACHE_FILE):
+    """
+    Write jieba dictionary and its serialized prefix dictionary model
+    :param samples_file: dictionary file of company
+    :param dict_file: output jieba dictionary
+    :param cache_file: output prefix dictionary model
+    :return: number of added words
+    """
+    try:
+        _vocabulary = get_vocabulary(samples_file)
+
+        # Frequency that keeps a word from being cut, computed by jieba default dictionary
+        _tokenizer = jieba.Tokenizer()
+        _tokenizer.initialize()
+        _entries = {}  # word -> [frequency, tag]
+        with _tokenizer.get_dict_file() as f:
+            for line in f:
+                _line = line.decode('utf-8').strip()
+                if _line:
+                    _word, _frequency, *_tag = _line.split(' ')
+                    _entries[_word] = [int(_frequency), _tag[0] if _tag else '']
+        _added = 0
+        for word, tag in _vocabulary.items():
+            _frequency = _tokenizer.suggest_freq(word, tune=False)
+            if word in _entries:
+                _entries[word][0] = max(_entries[word][0], _frequency)
+            else:
+                _entries[word] = [_frequency, tag]
+                _added += 1
+
+        for file_name in (dict_file, cache_file):
+            _dir = os.path.dirname(os.path.abspath(file_name))
+            if not os.path.exists(_dir):
+                os.makedirs(_dir)
+        with open(dict_file, 'w', encoding='utf-8') as f:
+            for word, (frequency, tag) in _entries.items():
+                f.write(f'{word} {frequency} {tag}\n' if tag else f'{word} {frequency}\n')
+
+        # Serialize prefix dictionary model, the stale model is never loaded again
+        if os.path.exists(cache_file):
+            os.remove(cache_file)
+        _tokenizer = jieba.Tokenizer(dict_file)
+        _tokenizer.cache_file = os.path.abspath(cache_file)
+        _tokenizer.initialize()
+        nlogger.info(f'build_jieba_dict: {dict_file} {len(_entries)} words, {_added} added')
+        return _added
+    except Exception as e:
+        nlogger.error('{fn} error: {e}'.format(fn='build_jieba_dict', e=traceback.format_exc()))
+        raise BuildDictError('{fn} error: {e}'.format(fn='build_jieba_dict', e=repr(e)))
+
+
+def main(argv):
+    _samples_file = SAMPLES_FILE
+    try:
+        opts, args = getopt.getopt(argv, "hf:", ["help", "file="])
+    except getopt.GetoptError:
+        print('Usage: jieba_dict.py -f <dictionary file of company>')
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print('Usage: jieba_dict.py -f <dictionary file of company>, default is SAMPLES_FILE')
+            sys.exit()
+        elif opt in ("-f", "--file"):
+            _samples_file = arg
+
+    _start = time.time()
+    _added = build_jieba_dict(_samples_file)
+    print(f'{JIEBA_DICT_FILE} has been built, {_added} words added, {time.time() - _start:.3f}s')
+    print(f'Dictionary loading: {init_jieba():.3f}s')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
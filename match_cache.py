@@ -0,0 +1,212 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Cache of extracted company name and match result
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from datetime import datetime
+from utils.util_cache import LRUCache
+from utils.util_hash import get_file_md5
+from utils.util_readfile import stream_iterator
+from utils.util_jieba import get_dictionary_fingerprint
+from settings import MEMO_CACHE_SIZE, MATCH_STORE_FILE, GUESS_MIN_SIMILARITY, FULL_NAME_LSH, LSH_BANDS, LSH_ROWS, \
+    TFIDF_NGRAM_RANGE
+
+# The row object properties that the match result of a company name consists of
+COMPANY_INFO_KEYS = ('result', 'company_name', 'guess_name', 'company_full_name', 'company_type', 'similarity')
+
+
+def get_company_info(row_object):
+    """
+    Get match result from row object
+    :param row_object: row object processed by set_row_object_company_info
+    :return: dict of match result and status
+    """
+    _company_info = {key: row_object.column_value.get(key) for key in COMPANY_INFO_KEYS}
+    _company_info['status'] = row_object.status
+    return _company_info
+
+
+def set_company_info(row_object, company_info):
+    """
+    Set match result to row object
+    :param row_object: row object
+    :param company_info: dict of match result and status
+    :return: row object
+    """
+    for key in COMPANY_INFO_KEYS:
+        row_object.column_value[key] = company_info.get(key)
+    row_object.status = company_info.get('status')
+    return row_object
+
+
+class MatchMemo(object):
+    """
+    Run-scoped memo, raw '公司' value -> extracted company name, extracted company name -> match result
+    """
+
+    def __init__(self, max_size=MEMO_CACHE_SIZE):
+        """
+        :param max_size: maximum number of keys of each cache, 0 means the memo is disabled
+        """
+        self.extract_cache = LRUCache(max_size)
+        self.match_cache = LRUCache(max_size)
+
+    def extract_company_name(self, source_company_name, func):
+        """
+        Get extracted company name of raw '公司' value
+        :param source_company_name: raw '公司' value
+        :param func: function that extracts company name
+        :return: extracted company name
+        """
+        return self.extract_cache.get_or_set(source_company_name, func, source_company_name)
+
+    def get_company_info(self, company_name):
+        """
+        :param company_name: extracted company name
+        :return: dict of match result and status, or None
+        """
+        return self.match_cache.get(company_name)
+
+    def set_company_info(self, company_name, company_info):
+        """
+        :param company_name: extracted company name
+        :param company_info: dict of match result and status
+        :return:
+        """
+        self.match_cache.set(company_name, company_info)
+
+    def stats(self):
+        return {'extract': self.extract_cache.stats(), 'match': self.match_cache.stats()}
+
+
+class MatchStore(object):
+    """
+    Persistent match result of company name in SQLite, reused by later runs.
+    Results are keyed by the fingerprint of dictionary file, jieba dictionary and the settings that change a match
+    result, so a change of any of them invalidates them.
+    """
+
+    def __init__(self, dict_file_name, engine='difflib', store_file=MATCH_STORE_FILE):
+        """
+        :param dict_file_name: dictionary file that Samples is built from
+        :param engine: name of similarity match engine
+        :param store_file: SQLite file
+        """
+        _settings = [get_file_md5(dict_file_name, stream_iterator), get_dictionary_fingerprint(), GUESS_MIN_SIMILARITY,
+                     FULL_NAME_LSH, LSH_BANDS, LSH_ROWS, list(TFIDF_NGRAM_RANGE)]
+        self.fingerprint = hashlib.md5(json.dumps(_settings).encode('utf-8')).hexdigest().upper()
+        self.engine = engine
+        self.store_file = store_file
+        self.read_only = False
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        _store_dir = os.path.dirname(os.path.abspath(store_file))
+        if not os.path.exists(_store_dir):
+            os.makedirs(_store_dir)
+        self._connection = sqlite3.connect(store_file, check_same_thread=False)
+        with self._connection:
+            self._connection.execute('CREATE TABLE IF NOT EXISTS match_result (fingerprint TEXT, engine TEXT, '
+                                     'company_name TEXT, result, guess_name, full_name, company_type, similarity, '
+                                     'status INTEGER, updated_at TEXT, '
+                                     'PRIMARY KEY (fingerprint, engine, company_name))')
+            # The results of other dictionary or settings are never used again
+            self._connection.execute('DELETE FROM match_result WHERE fingerprint != ?', (self.fingerprint,))
+
+    def get_company_info(self, company_name):
+        """
+        :param company_name: extracted company name
+        :return: dict of match result and status, or None
+        """
+        with self._lock:
+            _row = self._connection.execute(
+                'SELECT result, guess_name, full_name, company_type, similarity, status FROM match_result '
+                'WHERE fingerprint = ? AND engine = ? AND company_name = ?',
+                (self.fingerprint, self.engine, company_name)).fetchone()
+            if _row is None:
+                self.misses += 1
+                return
+            self.hits += 1
+        _company_info = dict(zip(('result', 'guess_name', 'company_full_name', 'company_type', 'similarity',
+                                  'status'), _row))
+        _company_info['company_name'] = company_name
+        return _company_info
+
+    def set_company_info(self, company_name, company_info):
+        """
+        Add match result, it's written when flush
+        :param company_name: extracted company name
+        :param company_info: dict of match result and status
+        :return:
+        """
+        if self.read_only:
+            return
+        with self._lock:
+            self._pending[company_name] = company_info
+
+    def flush(self):
+        """
+        Write the added match results in one transaction
+        :return: number of written results
+        """
+        with self._lock:
+            _pending, self._pending = self._pending, {}
+            _updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO match_result VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(self.fingerprint, self.engine, company_name, info.get('result'), info.get('guess_name'),
+                      info.get('company_full_name'), info.get('company_type'), info.get('similarity'),
+                      info.get('status'), _updated_at) for company_name, info in _pending.items()])
+            return len(_pending)
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def disconnect(self):
+        """
+        Write the added match results and close the connection, e.g. before forking worker processes which must not
+        inherit a live connection. connect() opens it again
+        :return:
+        """
+        self.flush()
+        self._connection.close()
+        self._connection = None
+
+    def connect(self):
+        self._connection = sqlite3.connect(self.store_file, check_same_thread=False)
+
+    def reopen(self, read_only=False):
+        """
+        Open another connection to the same store, e.g. in worker process which can't share the connection
+        :param read_only: if read_only is True, added match results are ignored
+        :return: instance of MatchStore
+        """
+        _store = MatchStore.__new__(MatchStore)
+        _store.__setstate__(self.__getstate__())
+        _store.read_only = read_only
+        return _store
+
+    def __getstate__(self):
+        return {'fingerprint': self.fingerprint, 'engine': self.engine, 'store_file': self.store_file}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.read_only = True
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.connect()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,110 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Merge sidecar results file into the source sheet, write a combined Excel
+
+python3.9 merge_result.py -f 'vid-20210214.xlsx' -t 'listing' -r 'result_20210214-10:00:00.csv'
+"""
+
+import os
+import sys
+import getopt
+from datetime import datetime
+from utils.util_xlsx import HandleXLSX, StreamWorkbookWriter
+from utils.util_text_reader import get_text_reader_class
+from utils.util_logfile import nlogger, traceback
+from result_sidecar import read_sidecar, get_result_sheet_values
+
+
+class MergeResultError(Exception):
+    pass
+
+
+def merge_result(file_name, sidecar_file_name, sheet_name=None, output_file_name=None):
+    """
+    Merge sidecar results into source sheet
+    :param file_name: source Excel, or CSV/TSV/JSONL file
+    :param sidecar_file_name: sidecar results file written by handle.py
+    :param sheet_name: sheet name of source rows, default active sheet
+    :param output_file_name: combined Excel, default result_<date>.xlsx
+    :return: output file name
+    """
+    try:
+        _text_reader_class = get_text_reader_class(file_name)
+        if _text_reader_class is not None:
+            _source_xls = _text_reader_class(file_name, sheet_name)
+        else:
+            _source_xls = HandleXLSX(file_name, sheet_name, read_only=True)
+        _sheet_title = _source_xls.sheet.title
+        _column_name_list = _source_xls.get_column_name_list()
+        _source_xls.close()
+
+        _sheet_values = {_sheet_title: get_result_sheet_values(_column_name_list, read_sidecar(sidecar_file_name))}
+        _output_file_name = output_file_name or "result_{d}.xlsx".format(d=datetime.now().strftime('%Y%m%d-%H:%M:%S'))
+        StreamWorkbookWriter(file_name, _source_xls.open_workbook).save(_output_file_name, _sheet_values)
+        nlogger.info(f'Merge result completed, output file: {_output_file_name}')
+        return _output_file_name
+    except Exception as e:
+        nlogger.error('{fn} error: {e}'.format(fn='merge_result', e=traceback.format_exc()))
+        raise MergeResultError('{fn} error: {e}'.format(fn='merge_result', e=repr(e)))
+
+
+def usage():
+    info = \
+        """
+Usage:
+    python3.9 merge_result.py -file -result [ -sheet -output ]
+    Help:
+     -h --help
+
+    Mandatory options:
+     -f --file    <source excel, or csv/tsv/jsonl file>
+     -r --result  <sidecar results file, xlsx, csv or jsonl>
+
+    Optional options:
+     -t --sheet   <The sheet name of source rows, default active sheet in Excel>
+     -o --output  <combined excel, default result_<date>.xlsx>
+        """
+    print(info)
+
+
+def main(argv):
+    _file_name = None
+    _sidecar_file_name = None
+    _sheet_name = None
+    _output_file_name = None
+
+    try:
+        opts, args = getopt.getopt(argv, "hf:r:t:o:", ["help", "file=", "result=", "sheet=", "output="])
+    except getopt.GetoptError:
+        print("Usage: python3.9 merge_result.py -f <source excel>  -r <sidecar results file>  -t <excel sheet>  "
+              "-o <combined excel>")
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        elif opt in ('-f', '--file'):
+            _file_name = str(arg).strip()
+        elif opt in ('-r', '--result'):
+            _sidecar_file_name = str(arg).strip()
+        elif opt in ('-t', '--sheet'):
+            _sheet_name = str(arg).strip()
+        elif opt in ('-o', '--output'):
+            _output_file_name = str(arg).strip()
+
+    if _file_name is None or _sidecar_file_name is None:
+        print("Invalid parameter, -f --file and -r --result must be provided. \nTry '-h --help' for more information.")
+        sys.exit(2)
+
+    for _name in (_file_name, _sidecar_file_name):
+        if not os.path.exists(_name):
+            print(f"{_name} does not exist.")
+            sys.exit(2)
+
+    print(f'Output file: {merge_result(_file_name, _sidecar_file_name, _sheet_name, _output_file_name)}')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
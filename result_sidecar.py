@@ -0,0 +1,138 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Sidecar results file, the result columns of each row keyed by row position.
+It's merged into the source sheet by merge_result.py only when a combined Excel is needed.
+"""
+
+import os
+import csv
+import json
+from openpyxl import Workbook, load_workbook
+from row_object import RESULT_FIELDS
+
+# Columns of sidecar file
+SIDECAR_COLUMNS = ('position',) + tuple(column_name for column_name, key in RESULT_FIELDS)
+SIDECAR_FORMATS = ('xlsx', 'csv', 'jsonl')
+
+
+class SidecarError(Exception):
+    pass
+
+
+def get_result_values(row_object):
+    """
+    Get the result values written for a row, 'result' is always written, the other columns only if they have value
+    :param row_object: row object processed by set_row_object_company_info
+    :return: {column name: value}
+    """
+    _values = {}
+    for column_name, key in RESULT_FIELDS:
+        if key == 'result':
+            _values[column_name] = row_object.column_value.get('result', 'unknown')
+        elif row_object.column_value.get(key):
+            _values[column_name] = row_object.column_value.get(key)
+    return _values
+
+
+def get_result_sheet_values(column_name_list, results):
+    """
+    Place result values in the cells of sheet, the result columns that sheet doesn't have are appended
+    :param column_name_list: column names of sheet
+    :param results: iterable of (row position, {column name: value})
+    :return: {row number: {column number: value}}
+    """
+    _column_name_list = list(column_name_list)
+    _columns_number = len(_column_name_list)
+    _header_values = {}
+    _result_columns = {}  # column name -> column number
+    for column_name, key in RESULT_FIELDS:
+        if column_name not in _column_name_list:
+            _column_name_list.append(column_name)
+        y = _column_name_list.index(column_name) + 1
+        if y > _columns_number:
+            _header_values[y] = column_name
+        _result_columns[column_name] = y
+
+    _sheet_values = {1: _header_values}
+    for position, values in results:
+        _row_values = _sheet_values.setdefault(position, {})
+        for column_name, value in values.items():
+            # An empty value of sidecar means the column isn't written, except 'result' that is always written
+            if column_name in _result_columns and (column_name == 'result' or value not in (None, '')):
+                _row_values[_result_columns[column_name]] = value if value != '' else None
+    return _sheet_values
+
+
+def get_sidecar_format(file_name):
+    """
+    :param file_name: sidecar file name
+    :return: format by file extension
+    """
+    _format = os.path.splitext(file_name)[1].lstrip('.').lower()
+    if _format not in SIDECAR_FORMATS:
+        raise SidecarError(f'Unsupported sidecar format: {file_name}, must be one of {SIDECAR_FORMATS}')
+    return _format
+
+
+def write_sidecar(file_name, row_objects):
+    """
+    Write result values of rows in order of position, format is chosen by file extension
+    :param file_name: sidecar file name, .xlsx .csv or .jsonl
+    :param row_objects: row objects processed by set_row_object_company_info
+    :return: number of rows
+    """
+    _format = get_sidecar_format(file_name)
+    _rows = sorted(((row_object.position, get_result_values(row_object)) for row_object in row_objects),
+                   key=lambda row: row[0])
+    if _format == 'jsonl':
+        with open(file_name, 'w', encoding='utf-8') as f:
+            for position, values in _rows:
+                f.write(json.dumps(dict(values, position=position), ensure_ascii=False) + '\n')
+    elif _format == 'csv':
+        with open(file_name, 'w', encoding='utf-8', newline='') as f:
+            _writer = csv.writer(f)
+            _writer.writerow(SIDECAR_COLUMNS)
+            for position, values in _rows:
+                _writer.writerow([position] + [values.get(column_name, '') for column_name in SIDECAR_COLUMNS[1:]])
+    else:
+        _work_book = Workbook(write_only=True)
+        _sheet = _work_book.create_sheet('result')
+        _sheet.append(SIDECAR_COLUMNS)
+        for position, values in _rows:
+            _sheet.append([position] + [values.get(column_name) for column_name in SIDECAR_COLUMNS[1:]])
+        _work_book.save(file_name)
+    return len(_rows)
+
+
+def read_sidecar(file_name):
+    """
+    Read result values of rows, format is chosen by file extension
+    :param file_name: sidecar file name
+    :return: iterator of (row position, {column name: value})
+    """
+    _format = get_sidecar_format(file_name)
+    if _format == 'jsonl':
+        with open(file_name, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    _values = json.loads(line)
+                    yield int(_values.pop('position')), _values
+    elif _format == 'csv':
+        with open(file_name, 'r', encoding='utf-8', newline='') as f:
+            for _values in csv.DictReader(f):
+                _position = int(_values.pop('position'))
+                # CSV has no type, similarity is the only number column
+                if _values.get('similarity'):
+                    _values['similarity'] = float(_values['similarity'])
+                yield _position, _values
+    else:
+        _work_book = load_workbook(file_name, read_only=True)
+        try:
+            _rows = _work_book.active.iter_rows(values_only=True)
+            _column_names = [str(column_name) for column_name in next(_rows)]
+            for row in _rows:
+                _values = dict(zip(_column_names, row))
+                yield int(_values.pop('position')), _values
+        finally:
+            _work_book.close()
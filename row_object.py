@@ -4,6 +4,15 @@ from enum import Enum
 from enum import unique
 
 
+# Result columns written to the sheet: (column name, key of row object column_value)
+RESULT_FIELDS = (('result', 'result'), ('name', 'company_name'), ('guess_name', 'guess_name'),
+                 ('full_name', 'company_full_name'), ('type', 'company_type'), ('similarity', 'similarity'))
+
+# Columns read from source sheet and dictionary sheet, the projected reader only parses these columns
+SOURCE_COLUMNS = ('公司',)
+SAMPLES_COLUMNS = ('单位名称', '简称', '单位类别')
+
+
 @unique
 class RowStatus(Enum):  # 枚举类
     """
@@ -0,0 +1,362 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Indexes over the names of Samples property, used to block candidates of similarity match
+"""
+
+import difflib
+import collections
+import random
+
+
+def get_ngrams(sequence, n):
+    """
+    Get the set of n-grams in sequence
+    :param sequence: string (characters) or list/tuple (jieba tokens)
+    :param n: n-gram size
+    :return: set of n-grams, string slices or tuples
+    """
+    if isinstance(sequence, str):
+        return {sequence[i:i + n] for i in range(len(sequence) - n + 1)}
+    else:
+        _sequence = tuple(sequence)
+        return {_sequence[i:i + n] for i in range(len(_sequence) - n + 1)}
+
+
+def get_length_bound(la, lb):
+    """
+    Upper bound of SequenceMatcher ratio by length, same as real_quick_ratio
+    :param la: length of sequence a
+    :param lb: length of sequence b
+    :return: upper bound of ratio
+    """
+    if not la and not lb:
+        return 1.0
+    return 2.0 * min(la, lb) / (la + lb)
+
+
+def get_disjoint_bound(la, lb, n):
+    """
+    Upper bound of SequenceMatcher ratio between two sequences that don't share any n-gram.
+    Without a common n-gram, the matching blocks are shorter than n and two adjacent blocks are separated
+    by at least one unmatched element, so 2 * matches + ceil(matches / (n - 1)) - 1 <= la + lb.
+    :param la: length of sequence a
+    :param lb: length of sequence b
+    :param n: n-gram size
+    :return: upper bound of ratio
+    """
+    if not la or not lb or n <= 1:
+        return 0
+    matches = min(la, lb)
+    while matches > 0 and 2 * matches + -(-matches // (n - 1)) - 1 > la + lb:
+        matches -= 1
+    return 2.0 * matches / (la + lb)
+
+
+class NGramIndex(object):
+    """
+    Inverted index from n-grams to the position of names in a Samples property
+    """
+
+    def __init__(self, n=2):
+        """
+        :param n: n-gram size
+        """
+        self.n = n
+        self.names = []  # position -> name
+        self.sequences = []  # position -> sequence of name to compare
+        self.counts = []  # position -> {element: count} of sequence, used by quick_ratio bound
+        self.postings = {}  # n-gram -> positions of names that include the n-gram
+        self.length_buckets = {}  # sequence length -> positions of names
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, sequence):
+        """
+        Add name into index
+        :param name: name in Samples property
+        :param sequence: the sequence of name to compare, characters or jieba token ids
+        :return: position of name
+        """
+        position = len(self.names)
+        self.names.append(name)
+        self.sequences.append(sequence)
+        self.counts.append(dict(collections.Counter(sequence)))
+        self.length_buckets.setdefault(len(sequence), []).append(position)
+        for gram in get_ngrams(sequence, self.n):
+            self.postings.setdefault(gram, []).append(position)
+        return position
+
+    def get_candidates(self, sequence, min_shared=1):
+        """
+        Get the position of names which share enough n-grams with sequence
+        :param sequence: query sequence
+        :param min_shared: minimum number of shared n-grams
+        :return: {position: number of shared n-grams}
+        """
+        _shared = {}
+        for gram in get_ngrams(sequence, self.n):
+            for position in self.postings.get(gram, ()):
+                _shared[position] = _shared.get(position, 0) + 1
+        if min_shared > 1:
+            return {position: count for position, count in _shared.items() if count >= min_shared}
+        return _shared
+
+    def get_quick_bound(self, query_count, la, position):
+        """
+        Upper bound of SequenceMatcher ratio by common elements, same as quick_ratio
+        :param query_count: {element: count} of query sequence
+        :param la: length of query sequence
+        :param position: position of name
+        :return: upper bound of ratio
+        """
+        matches = 0
+        for element, count in self.counts[position].items():
+            matches += min(count, query_count.get(element, 0))
+        return 2.0 * matches / (la + len(self.sequences[position]))
+
+    def search(self, sequence, min_score=0, positions=None, priority_positions=None):
+        """
+        Search the name with maximum SequenceMatcher ratio, same result as comparing with every name in order.
+        Each name is checked by cheap upper bounds first: length bound (real_quick_ratio), no common n-gram bound
+        and common element bound (quick_ratio), the exact ratio is computed only if the bound can beat the best.
+        Candidates sharing most n-grams are scored first, then the length buckets are visited by length bound,
+        the remaining buckets are skipped as a whole once their bound can't beat the best.
+        :param sequence: query sequence
+        :param min_score: the minimum useful ratio, the result must be greater than it
+        :param positions: only score the names in positions (e.g. blocked by LSH) instead of every name
+        :param priority_positions: score the names first (e.g. found by symmetric delete index), a high ratio found
+        early makes the bounds prune more names, the result is not changed
+        :return: maximum ratio, name; or 0, None if no ratio is greater than min_score
+        """
+        _best = [0, None]  # similarity, position
+        _length = len(sequence)
+        _query_count = dict(collections.Counter(sequence))
+        if positions is None:
+            _candidates = self.get_candidates(sequence)
+        else:
+            _candidates = dict.fromkeys(positions, 0)
+
+        def is_pruned(bound, position):
+            if bound <= min_score or bound < _best[0]:
+                return True
+            return bound == _best[0] and position > _best[1]
+
+        def score(position, bound):
+            if is_pruned(bound, position) or is_pruned(self.get_quick_bound(_query_count, _length, position),
+                                                       position):
+                return
+            similarity_rate = difflib.SequenceMatcher(None, sequence, self.sequences[position]).ratio()
+            if not is_pruned(similarity_rate, position) and (similarity_rate > _best[0] or position < _best[1]):
+                _best[0] = similarity_rate
+                _best[1] = position
+
+        # A priority position is scored once, later bounds only prune more so it isn't visited again.
+        # With positions, the priority positions out of them are not scored
+        _scored = set()
+        for position in priority_positions or ():
+            if position not in _scored and (positions is None or position in _candidates):
+                score(position, get_length_bound(_length, len(self.sequences[position])))
+                _scored.add(position)
+
+        for position in sorted(_candidates, key=lambda p: (-_candidates[p], p)):
+            if position not in _scored:
+                score(position, get_length_bound(_length, len(self.sequences[position])))
+
+        if positions is not None:
+            return self.get_result(*_best)
+
+        _buckets = sorted(((get_length_bound(_length, length), length) for length in self.length_buckets),
+                          reverse=True)
+        for length_bound, length in _buckets:
+            if length_bound <= min_score or length_bound < _best[0]:
+                break
+            bound = min(length_bound, get_disjoint_bound(_length, length, self.n))
+            for position in self.length_buckets[length]:
+                if position in _candidates or position in _scored:
+                    continue
+                if is_pruned(bound, position):
+                    break
+                score(position, bound)
+
+        return self.get_result(*_best)
+
+    def get_result(self, similarity_result, similarity_position):
+        """
+        :param similarity_result: maximum ratio
+        :param similarity_position: position of the most similar name, or None
+        :return: maximum ratio, name or None
+        """
+        similarity_name = self.names[similarity_position] if similarity_position is not None else None
+        return similarity_result, similarity_name
+
+
+class MinHashLSHIndex(object):
+    """
+    MinHash signature of every name with banded LSH buckets.
+    A query only collides with the names which probably have similar element sets, the probability that a name
+    with Jaccard similarity j collides is 1 - (1 - j ** rows) ** bands, so recall is tuned by bands and rows.
+    """
+    prime = (1 << 61) - 1
+
+    def __init__(self, bands=16, rows=4, seed=1):
+        """
+        :param bands: number of bands, more bands means higher recall
+        :param rows: number of MinHash values in a band, more rows means fewer candidates
+        :param seed: seed of hash functions, must be same when building and querying
+        """
+        self.bands = bands
+        self.rows = rows
+        _random = random.Random(seed)
+        self.hash_parameters = [(_random.randrange(1, self.prime), _random.randrange(0, self.prime))
+                                for _ in range(bands * rows)]
+        self.buckets = [{} for _ in range(bands)]  # band -> {band signature: positions of names}
+        self.size = 0
+        self.stats = {'queries': 0, 'candidates': 0, 'no_collision': 0}
+
+    def __len__(self):
+        return self.size
+
+    def get_signature(self, elements):
+        """
+        Get MinHash signature of an element set
+        :param elements: hashable integer elements, e.g. jieba token ids
+        :return: list of MinHash values
+        """
+        _elements = [element % self.prime for element in set(elements)]
+        if not _elements:
+            return []
+        _prime = self.prime
+        return [min((a * element + b) % _prime for element in _elements) for a, b in self.hash_parameters]
+
+    def get_band_keys(self, elements):
+        _signature = self.get_signature(elements)
+        if not _signature:
+            return []
+        return [tuple(_signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def add(self, position, elements):
+        """
+        Add a name into LSH buckets
+        :param position: position of name, same as the position in NGramIndex
+        :param elements: element set of name
+        :return:
+        """
+        for band, band_key in enumerate(self.get_band_keys(elements)):
+            self.buckets[band].setdefault(band_key, []).append(position)
+        self.size += 1
+
+    def get_candidates(self, elements):
+        """
+        Get the position of names that collide with query in any band
+        :param elements: element set of query
+        :return: sorted positions of names
+        """
+        _candidates = set()
+        for band, band_key in enumerate(self.get_band_keys(elements)):
+            _candidates.update(self.buckets[band].get(band_key, ()))
+        self.stats['queries'] += 1
+        self.stats['candidates'] += len(_candidates)
+        if not _candidates:
+            self.stats['no_collision'] += 1
+        return sorted(_candidates)
+
+    def get_stats(self):
+        """
+        Get blocking statistics
+        :return: dict of statistics
+        """
+        _stats = dict(self.stats, names=self.size, bands=self.bands, rows=self.rows)
+        _stats['average_candidates'] = round(_stats['candidates'] / _stats['queries'], 2) if _stats['queries'] else 0
+        return _stats
+
+
+def get_deletes(name, max_distance):
+    """
+    Get the strings made by deleting up to max_distance characters from name
+    :param name: name
+    :param max_distance: maximum number of deleted characters
+    :return: set of strings, include name itself
+    """
+    _deletes = {name}
+    _edge = {name}
+    for _ in range(max_distance):
+        _next_edge = set()
+        for word in _edge:
+            for i in range(len(word)):
+                _next_edge.add(word[:i] + word[i + 1:])
+        _next_edge -= _deletes
+        _deletes |= _next_edge
+        _edge = _next_edge
+    return _deletes
+
+
+def get_edit_distance(a, b, max_distance):
+    """
+    Levenshtein distance between two strings, stop early if it's greater than max_distance
+    :param a: string a
+    :param b: string b
+    :param max_distance: maximum distance of interest
+    :return: distance, or max_distance + 1 if it's greater than max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    _previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        _current = [i]
+        for j, char_b in enumerate(b, start=1):
+            _current.append(min(_previous[j] + 1, _current[j - 1] + 1, _previous[j - 1] + (char_a != char_b)))
+        if min(_current) > max_distance:
+            return max_distance + 1
+        _previous = _current
+    return _previous[-1] if _previous[-1] <= max_distance else max_distance + 1
+
+
+class SymmetricDeleteIndex(object):
+    """
+    Symmetric delete (SymSpell) index, finds the names within a small edit distance by hash lookups.
+    Every name is indexed by its deletes, a query looks up its own deletes, then candidates are verified.
+    """
+
+    def __init__(self, max_distance=2):
+        """
+        :param max_distance: maximum edit distance
+        """
+        self.max_distance = max_distance
+        self.names = []  # position -> name
+        self.deletes = {}  # delete string -> positions of names
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, position, name):
+        """
+        Add a name into index
+        :param position: position of name, same as the position in NGramIndex
+        :param name: name
+        :return:
+        """
+        while len(self.names) <= position:
+            self.names.append(None)
+        self.names[position] = name
+        for word in get_deletes(name, self.max_distance):
+            self.deletes.setdefault(word, []).append(position)
+
+    def lookup(self, name):
+        """
+        Get the names within max_distance of name
+        :param name: query name
+        :return: positions of names, sorted by edit distance then position
+        """
+        _checked = set()
+        _result = []
+        for word in get_deletes(name, self.max_distance):
+            for position in self.deletes.get(word, ()):
+                if position in _checked:
+                    continue
+                _checked.add(position)
+                _distance = get_edit_distance(name, self.names[position], self.max_distance)
+                if _distance <= self.max_distance:
+                    _result.append((_distance, position))
+        return [position for _distance, position in sorted(_result)]
@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Pickle snapshot of built Samples, include the record table and the indexes of similarity match.
+The whole Samples is unpickled on load, it saves building Samples and indexes from dictionary file
+"""
+
+import os
+import json
+import glob
+import pickle
+import struct
+from utils.util_hash import get_file_md5
+from utils.util_readfile import stream_iterator
+from utils.util_jieba import get_dictionary_fingerprint
+from utils.util_logfile import nlogger, traceback
+from settings import SAMPLES_SNAPSHOT_DIR, ABBR_NGRAM_SIZE, FULL_NGRAM_SIZE, FULL_NAME_LSH, LSH_BANDS, LSH_ROWS, \
+    ABBR_EDIT_DISTANCE
+
+# File layout: magic, header (version, length of metadata), JSON metadata, pickled Samples
+SNAPSHOT_MAGIC = b'SAMPSNAP'
+SNAPSHOT_HEADER = struct.Struct('<HI')
+# Increase it when the structure of Samples or indexes changes, the snapshots of other versions are rebuilt
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class SamplesSnapshot(object):
+    """
+    Snapshot of the Samples built from a dictionary file.
+    It's keyed by the md5 of dictionary file, jieba dictionary and index settings, a changed key means rebuilding.
+    """
+
+    def __init__(self, dict_file_name, snapshot_dir=SAMPLES_SNAPSHOT_DIR):
+        """
+        :param dict_file_name: dictionary file that Samples is built from
+        :param snapshot_dir: directory of snapshot files
+        """
+        self.dict_md5 = get_file_md5(dict_file_name, stream_iterator)
+        self.snapshot_dir = snapshot_dir
+        self.metadata = {
+            'version': SNAPSHOT_VERSION,
+            'dict_md5': self.dict_md5,
+            'jieba': get_dictionary_fingerprint(),
+            'index': [ABBR_NGRAM_SIZE, FULL_NGRAM_SIZE, FULL_NAME_LSH, LSH_BANDS, LSH_ROWS, ABBR_EDIT_DISTANCE],
+        }
+        self.snapshot_file = os.path.join(snapshot_dir, f'samples_{self.dict_md5}.snapshot')
+
+    def load(self):
+        """
+        Load Samples from snapshot file, the header and metadata are checked before the pickled Samples is read
+        :return: instance of Samples, or None if snapshot doesn't exist or is stale
+        """
+        if not os.path.exists(self.snapshot_file):
+            return
+        try:
+            with open(self.snapshot_file, 'rb') as f:
+                if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                    raise SnapshotError(f'{self.snapshot_file} is not a Samples snapshot')
+                _version, _metadata_length = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+                if _version != SNAPSHOT_VERSION:
+                    nlogger.info(f'{self.snapshot_file} version {_version} is stale')
+                    return
+                _metadata = json.loads(f.read(_metadata_length).decode('utf-8'))
+                if _metadata != self.metadata:
+                    nlogger.info(f'{self.snapshot_file} is stale: {_metadata}')
+                    return
+                return pickle.load(f)
+        except Exception as e:
+            nlogger.warning('{fn} error: {e}'.format(fn='SamplesSnapshot.load', e=traceback.format_exc()))
+            return
+
+    def save(self, samples_object):
+        """
+        Write snapshot file, the snapshots of other dictionary files are removed
+        :param samples_object: instance of Samples, built and frozen
+        :return: snapshot file name
+        """
+        try:
+            if not os.path.exists(self.snapshot_dir):
+                os.makedirs(self.snapshot_dir)
+            _metadata = json.dumps(self.metadata).encode('utf-8')
+            _temp_file = f'{self.snapshot_file}.{os.getpid()}.tmp'
+            with open(_temp_file, 'wb') as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_VERSION, len(_metadata)))
+                f.write(_metadata)
+                pickle.dump(samples_object, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(_temp_file, self.snapshot_file)
+
+            for file_name in glob.glob(os.path.join(self.snapshot_dir, 'samples_*.snapshot')):
+                if file_name != self.snapshot_file:
+                    os.remove(file_name)
+            return self.snapshot_file
+        except Exception as e:
+            nlogger.error('{fn} error: {e}'.format(fn='SamplesSnapshot.save', e=traceback.format_exc()))
+            raise SnapshotError('{fn} error: {e}'.format(fn='SamplesSnapshot.save', e=repr(e)))
@@ -2,17 +2,106 @@
 """
 settings for vhalldata project.
 """
+import os
 from province import PROVINCE
 
 # ThreadPoolExecutor max_workers
 MAX_WORKERS = 4
 
+# Execution mode of handling rows: 'thread' ThreadPoolExecutor, 'process' ProcessPoolExecutor
+EXECUTION_MODE = 'thread'
+
+# ProcessPoolExecutor max_workers, and the number of rows sent to worker in one task
+MAX_PROCESS_WORKERS = os.cpu_count() or 4
+PROCESS_CHUNK_SIZE = 500
+
 # Thread task execution waiting time(s). as_completed
 TASK_WAITING_TIME = 3600 * 1
 
+# Candidate blocking of similarity match, n-gram size of abbreviation(character) and full name(jieba token)
+ABBR_NGRAM_SIZE = 2
+FULL_NGRAM_SIZE = 1
+
+# MinHash LSH blocking of full name, only the names colliding with query are re-scored.
+# A name with token Jaccard similarity j collides with probability 1 - (1 - j ** LSH_ROWS) ** LSH_BANDS,
+# raise LSH_BANDS or lower LSH_ROWS for higher recall.
+FULL_NAME_LSH = False
+LSH_BANDS = 16
+LSH_ROWS = 4
+
+# Symmetric delete index of abbreviation, maximum edit distance of fast lookup. 0 means disabled
+ABBR_EDIT_DISTANCE = 2
+
+# Similarity must be greater than it to guess company name, the lower similarity is unknown company
+GUESS_MIN_SIMILARITY = 0.5
+
+# Similarity match engine: 'difflib' SequenceMatcher ratio of each row, 'tfidf' sparse TF-IDF of whole batch
+MATCH_ENGINE = 'difflib'
+
+# TF-IDF engine, character n-gram range and the number of names in one matrix product
+TFIDF_NGRAM_RANGE = (1, 2)
+TFIDF_CHUNK_SIZE = 2000
+
+# Run-scoped memo of extracted company name and match result, maximum number of names. 0 means disabled
+MEMO_CACHE_SIZE = 100000
+
+# Persistent match result reused by later runs, SQLite file. None means disabled
+MATCH_STORE_FILE = 'cache/match_result.sqlite3'
+
+# jieba segmentation cache shared by all call sites, maximum number of texts. 0 means disabled
+JIEBA_CACHE_SIZE = 100000
+
+# jieba uses HMM model to find the words that aren't in dictionary, it's on by default. False switches it off
+JIEBA_HMM = True
+
+# jieba dictionary with the words of PROVINCE and Samples abbreviations, and its serialized prefix dictionary model.
+# They are built by 'python3.9 jieba_dict.py', jieba default dictionary is used if the dictionary doesn't exist
+JIEBA_DICT_FILE = 'cache/jieba_dict.txt'
+JIEBA_CACHE_FILE = 'cache/jieba_dict.cache'
+
+# Pickle snapshot of built Samples and indexes, reused while dictionary file, jieba dictionary and index settings
+# don't change. None means disabled
+SAMPLES_SNAPSHOT_DIR = 'cache/samples'
+
+# Handle each distinct '公司' value once and copy the result to all rows with the value
+DEDUPE_ROWS = False
+
+# Open source excel in read-only mode, rows are streamed with constant memory.
+# Read-only source excel is written by the 'stream' result writer unless RESULT_WRITER is 'inplace'
+XLSX_READ_ONLY = False
+
+# Read-only excel is read by the column-projected reader, it parses sheet XML in the .xlsx zip and only the needed
+# columns are converted. False means openpyxl read-only workbook
+XLSX_PROJECTED_READER = True
+
+# Encoding of CSV, TSV and JSONL source file, 'utf-8-sig' also reads the file with BOM exported by Excel
+TEXT_ENCODING = 'utf-8-sig'
+
+# Result output: 'workbook' writes source excel with result columns,
+# 'xlsx', 'csv' or 'jsonl' writes a sidecar file of result columns keyed by row position, merged by merge_result.py
+RESULT_OUTPUT = 'workbook'
+
+# Result workbook writer: 'inplace' writes result columns into the fully loaded source workbook and saves it, styles,
+# number formats, merged cells, column widths, hyperlinks, comments, data validation, charts and images are kept.
+# 'stream' streams source rows into a write-only workbook with flat memory, only values and formulas are kept.
+# 'auto' is 'inplace' if source excel is loaded in full mode (not read-only and no sheet cache), 'stream' otherwise.
+# Text source is always streamed, merge_result.py always streams
+RESULT_WRITER = 'auto'
+
+# Directory of binary columnar cache of source excel sheet keyed by file md5, sheet name and the needed columns.
+# It's converted on first read and later runs of any row range seek to the rows in cache instead of parsing excel,
+# so it pays off only when the same file is run again. None means disabled, -k --sheet-cache enables it
+SHEET_CACHE_DIR = None
+
+# Maximum number of sheet caches, the least recently used ones are removed
+SHEET_CACHE_MAX_FILES = 10
+
 # Dictionary file
 SAMPLES_FILE = '会员单位名单.xlsx'
 
+# Pre-trim words, the company name is cut after the first word found in order of priority from left to right
+PRE_TRIM_WORDS = ['公司', '银行', '集团']
+
 # Exclude words
 # EXCLUDE_WORDS = ['中国', '股份', '有限', '公司', '集团', '销售', '代理', '经纪', '销售', '公估', '服务']
 EXCLUDE_WORDS = ['产险', '财险', '寿险']
@@ -0,0 +1,388 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Binary columnar cache of the projected columns of parsed source sheets, later runs read the cached columns of
+any row range instead of parsing Excel again
+"""
+
+import os
+import json
+import mmap
+import glob
+import pickle
+import struct
+import hashlib
+from utils.util_hash import get_file_md5
+from utils.util_readfile import stream_iterator
+from utils.util_xlsx_reader import ProjectedXLSX
+from utils.util_logfile import nlogger, traceback
+from settings import SHEET_CACHE_DIR, SHEET_CACHE_MAX_FILES
+
+# File layout: magic, header (version, offset and length of metadata), row groups, JSON metadata.
+# The column name row is kept in metadata, the rows from 2 are in row groups. A row group stores each cached
+# column as a chunk: offsets of values ('<Q', one more than rows) then encoded values, so the values of a row
+# range are sliced from the chunk without decoding the others.
+CACHE_MAGIC = b'SHEETCAC'
+CACHE_HEADER = struct.Struct('<HQI')
+# Increase it when the file layout or value encoding changes, the caches of other versions are rebuilt
+CACHE_VERSION = 2
+# Rows of a row group, memory of building the cache is bounded by one row group
+CACHE_GROUP_ROWS = 65536
+
+FLOAT_STRUCT = struct.Struct('<d')
+
+
+class SheetCacheError(Exception):
+    pass
+
+
+def encode_value(value):
+    """
+    Encode cell value, the type is kept
+    :param value: cell value
+    :return: bytes, empty for None
+    """
+    if value is None:
+        return b''
+    if isinstance(value, bool):
+        return b'T' if value else b'F'
+    if isinstance(value, str):
+        return b'S' + value.encode('utf-8')
+    if isinstance(value, int):
+        return b'I' + str(value).encode('ascii')
+    if isinstance(value, float):
+        return b'R' + FLOAT_STRUCT.pack(value)
+    # datetime, date, time, timedelta and others
+    return b'P' + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_value(data):
+    """
+    :param data: bytes of encode_value
+    :return: cell value
+    """
+    if not data:
+        return None
+    _tag = data[:1]
+    if _tag == b'S':
+        return data[1:].decode('utf-8')
+    if _tag == b'I':
+        return int(data[1:])
+    if _tag == b'R':
+        return FLOAT_STRUCT.unpack(data[1:])[0]
+    if _tag == b'T':
+        return True
+    if _tag == b'F':
+        return False
+    if _tag == b'P':
+        return pickle.loads(data[1:])
+    raise SheetCacheError(f'Unknown value tag {_tag!r}')
+
+
+class SheetCache(object):
+    """
+    Cache of the projected columns of a sheet, keyed by the md5 of source file, sheet name, the projected column
+    names and whether values are calculated (data_only).
+    The least recently used caches are removed when there are more than SHEET_CACHE_MAX_FILES.
+    """
+
+    def __init__(self, file_name, sheet_name=None, data_only=True, columns=None, cache_dir=SHEET_CACHE_DIR,
+                 max_files=SHEET_CACHE_MAX_FILES):
+        """
+        :param file_name: source Excel file name
+        :param sheet_name: sheet name, None means active sheet
+        :param data_only: True if the reader reads the values that Excel calculated, False if it reads formulas
+        :param columns: column names that are cached, None means all columns
+        :param cache_dir: directory of cache files
+        :param max_files: maximum number of cache files
+        """
+        self.file_md5 = get_file_md5(file_name, stream_iterator)
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        self.metadata = {
+            'version': CACHE_VERSION,
+            'file_md5': self.file_md5,
+            'sheet': str(sheet_name).strip() if sheet_name else None,
+            'data_only': bool(data_only),
+            'column_names': list(columns) if columns else None,
+        }
+        _key = hashlib.md5(json.dumps(self.metadata, sort_keys=True).encode('utf-8')).hexdigest()
+        self.cache_file = os.path.join(cache_dir, f'sheet_{_key}.cache')
+
+    def load(self):
+        """
+        Open cache file by memory map
+        :return: instance of CachedSheet, or None if cache doesn't exist or is stale
+        """
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            _cached_sheet = CachedSheet(self.cache_file)
+            if {key: _cached_sheet.metadata.get(key) for key in self.metadata} != self.metadata:
+                nlogger.info(f'{self.cache_file} is stale')
+                _cached_sheet.close()
+                return
+            # Mark it as recently used
+            os.utime(self.cache_file)
+            return _cached_sheet
+        except Exception as e:
+            nlogger.warning('{fn} error: {e}'.format(fn='SheetCache.load', e=traceback.format_exc()))
+            return
+
+    def get_projection(self, column_name_list):
+        """
+        Get the column numbers of cached columns, a duplicate column name refers to its last column like
+        ProjectedXLSX.get_projection
+        :param column_name_list: column name list of sheet
+        :return: list of column numbers
+        """
+        _all_columns = list(range(1, len(column_name_list) + 1))
+        if self.metadata['column_names'] is None:
+            return _all_columns
+        _column_numbers = {column_name: number for number, column_name in enumerate(column_name_list, start=1)}
+        _projection = [_column_numbers[column_name] for column_name in self.metadata['column_names']
+                       if column_name in _column_numbers]
+        return _projection or _all_columns
+
+    @staticmethod
+    def iter_projected_rows(source_xls, columns, max_row):
+        """
+        Rows from 2 of the current sheet of reader, rows missing in sheet are empty like the reader yields
+        :param source_xls: instance of HandleXLSX or ProjectedXLSX
+        :param columns: column numbers
+        :param max_row: the last row number
+        :return: iterator of (row number, {column number: value})
+        """
+        _sheet = source_xls.sheet
+        if hasattr(_sheet, 'iter_projected_rows'):
+            yield from _sheet.iter_projected_rows(columns, 2, max_row)
+            return
+        _max_column = max(columns) if columns else 0
+        for row_number, row in enumerate(_sheet.iter_rows(min_row=2, max_row=max_row, max_col=_max_column,
+                                                          values_only=True), start=2):
+            yield row_number, {column: row[column - 1] for column in columns if column <= len(row)}
+
+    def save(self, source_xls, group_rows=CACHE_GROUP_ROWS):
+        """
+        Convert the cached columns of the current sheet of reader into cache file, the rows are read once
+        :param source_xls: instance of HandleXLSX or ProjectedXLSX whose sheet is cached
+        :param group_rows: rows of a row group
+        :return: cache file name
+        """
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            _max_row, _max_column = source_xls.get_dimensions()
+            _column_name_list = source_xls.get_column_name_list()
+            _columns = self.get_projection(_column_name_list)
+            _groups = []
+            _last_row = 1
+            _temp_file = f'{self.cache_file}.{os.getpid()}.tmp'
+            with open(_temp_file, 'wb') as f:
+                f.write(CACHE_MAGIC)
+                f.write(CACHE_HEADER.pack(CACHE_VERSION, 0, 0))
+                _group = []
+                for row_number, values in self.iter_projected_rows(source_xls, _columns, _max_row):
+                    # Rows are consecutive, a row number is its position in the row groups
+                    for cached_row_number in range(_last_row + 1, row_number + 1):
+                        _group.append(values if cached_row_number == row_number else {})
+                        if len(_group) >= group_rows:
+                            _groups.append(self.write_group(f, _group, _columns))
+                            _group = []
+                    _last_row = max(_last_row, row_number)
+                if _group:
+                    _groups.append(self.write_group(f, _group, _columns))
+
+                _metadata = dict(self.metadata, title=source_xls.sheet.title, max_row=_max_row,
+                                 max_column=_max_column, header=_column_name_list, columns=_columns,
+                                 rows=_last_row - 1, group_rows=group_rows, groups=_groups)
+                _metadata = json.dumps(_metadata).encode('utf-8')
+                _metadata_offset = f.tell()
+                f.write(_metadata)
+                f.seek(len(CACHE_MAGIC))
+                f.write(CACHE_HEADER.pack(CACHE_VERSION, _metadata_offset, len(_metadata)))
+            os.replace(_temp_file, self.cache_file)
+            self.remove_least_recently_used()
+            return self.cache_file
+        except Exception as e:
+            nlogger.error('{fn} error: {e}'.format(fn='SheetCache.save', e=traceback.format_exc()))
+            raise SheetCacheError('{fn} error: {e}'.format(fn='SheetCache.save', e=repr(e)))
+
+    @staticmethod
+    def write_group(f, rows, columns):
+        """
+        Write a row group column by column
+        :param f: cache file
+        :param rows: {column number: value} of rows
+        :param columns: cached column numbers
+        :return: file offset of each column chunk
+        """
+        _chunk_offsets = []
+        for column in columns:
+            _values = [encode_value(row.get(column)) for row in rows]
+            _offsets = [0]
+            for value in _values:
+                _offsets.append(_offsets[-1] + len(value))
+            _chunk_offsets.append(f.tell())
+            f.write(struct.pack(f'<{len(_offsets)}Q', *_offsets))
+            f.write(b''.join(_values))
+        return _chunk_offsets
+
+    def remove_least_recently_used(self):
+        _cache_files = sorted(glob.glob(os.path.join(self.cache_dir, 'sheet_*.cache')), key=os.path.getmtime,
+                              reverse=True)
+        for file_name in _cache_files[max(self.max_files, 1):]:
+            if file_name != self.cache_file:
+                os.remove(file_name)
+
+
+class CachedSheet(object):
+    """
+    Sheet read from cache file by memory map, rows are the same as the reader that the cache is converted from.
+    Row 1 is the column name row, the columns that are not cached are empty in the rows from 2.
+    """
+
+    def __init__(self, cache_file):
+        """
+        :param cache_file: cache file name
+        """
+        self.cache_file = cache_file
+        self._file = open(cache_file, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            _offset = len(CACHE_MAGIC)
+            if self._mmap[:_offset] != CACHE_MAGIC:
+                raise SheetCacheError(f'{cache_file} is not a sheet cache')
+            _version, _metadata_offset, _metadata_length = CACHE_HEADER.unpack_from(self._mmap, _offset)
+            if _version != CACHE_VERSION or not _metadata_offset:
+                raise SheetCacheError(f'{cache_file} version {_version} is stale')
+            self.metadata = json.loads(self._mmap[_metadata_offset:_metadata_offset + _metadata_length])
+        except Exception:
+            self.close()
+            raise
+        self.title = self.metadata['title']
+        self.max_row = self.metadata['max_row']
+        self.max_column = self.metadata['max_column']
+        self.header = self.metadata['header']
+        self.rows = self.metadata['rows']
+        # column number -> chunk index in row group
+        self.columns = {column: index for index, column in enumerate(self.metadata['columns'])}
+        self.group_rows = self.metadata['group_rows']
+        self.groups = self.metadata['groups']
+
+    def calculate_dimension(self, force=False):
+        pass
+
+    def read_column(self, group, column, start, end):
+        """
+        :param group: row group index
+        :param column: cached column number
+        :param start: first row index in group, from 0
+        :param end: end row index in group, exclusive
+        :return: list of values
+        """
+        _chunk_offset = self.groups[group][self.columns[column]]
+        _group_size = min(self.group_rows, self.rows - group * self.group_rows)
+        _values_offset = _chunk_offset + 8 * (_group_size + 1)
+        _offsets = struct.unpack_from(f'<{end - start + 1}Q', self._mmap, _chunk_offset + 8 * start)
+        _mmap = self._mmap
+        return [decode_value(_mmap[_values_offset + _offsets[i]:_values_offset + _offsets[i + 1]])
+                for i in range(end - start)]
+
+    def iter_projected_rows(self, columns=None, min_row=1, max_row=None):
+        """
+        Seek to the row range and decode only the columns
+        :param columns: list of column numbers, None means all columns
+        :param min_row: the first row number
+        :param max_row: the last row number, default the last cached row
+        :return: iterator of (row number, {column number: value})
+        """
+        _columns = [column for column in (columns if columns is not None else range(1, self.max_column + 1))
+                    if 1 <= column <= self.max_column]
+        if min_row <= 1 and (max_row is None or max_row >= 1):
+            yield 1, {column: self.header[column - 1] for column in _columns if column <= len(self.header)}
+        _cached_columns = [column for column in _columns if column in self.columns]
+        # Row 2 is the first row of row groups
+        _first = max(min_row, 2) - 2
+        _last = min(max_row - 1 if max_row else self.rows, self.rows)
+        for group in range(_first // self.group_rows, (_last - 1) // self.group_rows + 1 if _last > _first else 0):
+            _group_start = group * self.group_rows
+            _start = max(_first, _group_start) - _group_start
+            _end = min(_last, _group_start + self.group_rows) - _group_start
+            _values = [self.read_column(group, column, _start, _end) for column in _cached_columns]
+            for index in range(_end - _start):
+                yield _group_start + _start + index + 2, {column: values[index]
+                                                          for column, values in zip(_cached_columns, _values)
+                                                          if values[index] is not None}
+
+    def iter_rows(self, min_row=None, max_row=None, min_col=None, max_col=None, values_only=True):
+        """
+        Rows of values like iter_rows of openpyxl worksheet, cached sheet has no cell objects
+        :param min_row: the first row number, default 1
+        :param max_row: the last row number, default the last cached row
+        :param min_col: the first column number, default 1
+        :param max_col: the last column number, default max column
+        :param values_only: always values
+        :return: iterator of tuples
+        """
+        _columns = list(range(min_col or 1, (max_col or self.max_column) + 1))
+        for row_number, values in self.iter_projected_rows(_columns, min_row or 1, max_row):
+            yield tuple(values.get(column) for column in _columns)
+
+    def close(self):
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+class CachedWorkbook(object):
+    """
+    Workbook of a cached sheet, the sheet name of command line refers to the cached sheet
+    """
+
+    def __init__(self, cached_sheet):
+        self._sheet = cached_sheet
+
+    @property
+    def worksheets(self):
+        return [self._sheet]
+
+    @property
+    def sheetnames(self):
+        return [self._sheet.title]
+
+    @property
+    def active(self):
+        return self._sheet
+
+    def __getitem__(self, sheet_name):
+        return self._sheet
+
+    def close(self):
+        self._sheet.close()
+
+
+class CachedXLSX(ProjectedXLSX):
+    """
+    Read-only HandleXLSX backed by a cached sheet, row objects only carry the requested columns.
+    Written values are saved by StreamWorkbookWriter from the source Excel, like read-only HandleXLSX.
+    """
+
+    def __init__(self, file_name, cached_sheet, columns=None, **kwargs):
+        """
+        :param file_name: source Excel file name
+        :param cached_sheet: instance of CachedSheet loaded by SheetCache
+        :param columns: column names that row objects carry, None means all columns
+        :param kwargs:
+        """
+        self._cached_sheet = cached_sheet
+        super(CachedXLSX, self).__init__(file_name, None, columns=columns, **kwargs)
+
+    @property
+    def work_book(self):
+        return self._work_book
+
+    @work_book.setter
+    def work_book(self, file_name):
+        self._work_book = CachedWorkbook(self._cached_sheet)
@@ -2,72 +2,181 @@
 __author__ = 'shijin'
 
 import re
+import sys
+from array import array
+from types import MappingProxyType
 from pprint import pprint
 from utils.util_xlsx import HandleXLSX
 from utils.util_logfile import nlogger, flogger, slogger, traceback
-from utils.util_re import re_bank, re_agency_company, re_appraisal_company, re_economic_company, re_insurance, \
-    re_sale_company
+from utils.util_jieba import cached_lcut
+from company_type import classify_company_type
+from samples_index import NGramIndex, MinHashLSHIndex, SymmetricDeleteIndex
+from settings import ABBR_NGRAM_SIZE, FULL_NGRAM_SIZE, FULL_NAME_LSH, LSH_BANDS, LSH_ROWS, ABBR_EDIT_DISTANCE
+
+
+class SamplesFrozenError(Exception):
+    pass
 
 
 class Samples(object):
-    all_name = {}
-    all_full_name = {}
-    all_abbr_name = {}
-
-    bank_name = {}
-    bank_full_name = {}
-    bank_abbr_name = {}
-
-    insurance_appraisal_name = {}
-    insurance_appraisal_full_name = {}
-    insurance_appraisal_abbr_name = {}
-
-    insurance_economic_name = {}
-    insurance_economic_full_name = {}
-    insurance_economic_abbr_name = {}
-
-    insurance_agency_name = {}
-    insurance_agency_full_name = {}
-    insurance_agency_abbr_name = {}
-
-    insurance_sale_name = {}
-    insurance_sale_full_name = {}
-    insurance_sale_abbr_name = {}
-
-    insurance_company_name = {}
-    insurance_company_full_name = {}
-    insurance_company_abbr_name = {}
-
-    related_institutions_name = {}
-    related_institutions_full_name = {}
-    related_institutions_abbr_name = {}
-
-    # insurance_company_type = {
-    #     'insurance_economic': {'full': 'insurance_economic_full_name',
-    #                            'abbr': 'insurance_economic_abbr_name'},
-    #     'insurance_agency': {'full': 'insurance_agency_full_name',
-    #                          'abbr': 'insurance_agency_abbr_name'},
-    #     'insurance_sale': {'full': 'insurance_sale_full_name',
-    #                        'abbr': 'insurance_sale_abbr_name'},
-    #     'insurance_appraisal': {'full': 'insurance_appraisal_full_name',
-    #                             'abbr': 'insurance_appraisal_abbr_name'},
-    #     'related_institutions': {'full': 'related_institutions_full_name',
-    #                              'abbr': 'related_institutions_abbr_name'},
-    # }
+    """
+    Compact store of company dictionary.
+    Every name string is interned once, every company record is stored once, and each property (category) maps its
+    names to integer record ids. After freeze, the names of each property are also kept as an array of name ids,
+    and the store is read-only, so it's shared by threads and process workers without copying.
+    """
+    __slots__ = ('names', 'name_ids', 'records', 'record_keys', 'categories', 'category_codes', 'category_record_ids',
+                 'category_name_ids', 'frozen', 'ngram_index', 'lsh_index', 'symmetric_delete_index', 'token_ids',
+                 'name_token_ids')
+
+    # Samples property name prefixes that similarity match compares with
+    search_types = ['all', 'bank', 'insurance_appraisal', 'insurance_economic', 'insurance_agency', 'insurance_sale',
+                    'insurance_company', 'related_institutions']
+
+    # Property names with fixed category codes, code is the position in tuple
+    property_names = tuple(f'{search_type}{suffix}' for search_type in search_types
+                           for suffix in ('_name', '_full_name', '_abbr_name'))
+
+    def __init__(self):
+        self.names = []  # name id -> interned name
+        self.name_ids = {}  # name -> name id
+        self.records = []  # record id -> company record, the termination dict of full name
+        self.record_keys = {}  # (full name property name, full name) -> record id
+        self.categories = list(self.property_names)  # category code -> property name
+        self.category_codes = {name: code for code, name in enumerate(self.categories)}  # property name -> code
+        self.category_record_ids = [{} for _ in self.categories]  # category code -> {name: record id}
+        self.category_name_ids = None  # category code -> array of name ids in order of insertion, set by freeze
+        self.frozen = False
+
+        self.ngram_index = None
+        self.lsh_index = None
+        self.symmetric_delete_index = None
+
+        self.token_ids = None  # jieba token -> integer token id
+        self.name_token_ids = None  # full name -> tuple of jieba token ids
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def intern_name(self, name):
+        """
+        Get the only stored string object of name
+        :param name: name
+        :return: interned name
+        """
+        _name_id = self.name_ids.get(name)
+        if _name_id is None:
+            _name = sys.intern(name)
+            self.name_ids[_name] = len(self.names)
+            self.names.append(_name)
+            return _name
+        return self.names[_name_id]
+
+    def get_category_code(self, property_name, create=False):
+        """
+        :param property_name: property name
+        :param create: add a category if property name is unknown
+        :return: category code, or None if property name is unknown
+        """
+        _code = self.category_codes.get(property_name)
+        if _code is None and create:
+            self.check_writable()
+            _code = len(self.categories)
+            self.categories.append(property_name)
+            self.category_codes[property_name] = _code
+            self.category_record_ids.append({})
+        return _code
+
+    def check_writable(self):
+        if self.frozen:
+            raise SamplesFrozenError('Samples is read-only after freeze')
 
     def get_property(self, property_name):
-        if hasattr(self, property_name):
-            return getattr(self, property_name)
+        """
+        Get names of property
+        :param property_name: property name
+        :return: read-only {name: record id} in order of insertion
+        """
+        _code = self.get_category_code(property_name)
+        if _code is None:
+            return MappingProxyType({})
+        return MappingProxyType(self.category_record_ids[_code])
+
+    def get_property_names(self, property_name):
+        """
+        :param property_name: property name
+        :return: list of names of property in order of insertion
+        """
+        _code = self.get_category_code(property_name)
+        if _code is None:
+            return []
+        if self.category_name_ids is not None:
+            return [self.names[name_id] for name_id in self.category_name_ids[_code]]
+        return list(self.category_record_ids[_code])
+
+    def add_record(self, property_full_name, full_name, record):
+        """
+        Add company record of full name, the same full name in the same property reuses its record id
+        :param property_full_name: full name property name
+        :param full_name: full name
+        :param record: termination dict of full name
+        :return: record id
+        """
+        self.check_writable()
+        _full_name = self.intern_name(full_name)
+        _record_id = self.record_keys.get((property_full_name, _full_name))
+        if _record_id is None:
+            _record_id = len(self.records)
+            self.record_keys[(property_full_name, _full_name)] = _record_id
+            self.records.append(record)
         else:
-            setattr(self, property_name, {})
-            return getattr(self, property_name)
+            self.records[_record_id] = record
+        self.category_record_ids[self.get_category_code(property_full_name, create=True)][_full_name] = _record_id
+        return _record_id
+
+    def add_alias(self, property_name, name, property_full_name, full_name):
+        """
+        Add name of property that refers to the record of full name
+        :param property_name: property name
+        :param name: full name, abbreviation or brief name
+        :param property_full_name: full name property name of the record
+        :param full_name: full name of the record
+        :return:
+        """
+        self.check_writable()
+        _record_id = self.record_keys[(property_full_name, full_name)]
+        self.category_record_ids[self.get_category_code(property_name, create=True)][self.intern_name(name)] = \
+            _record_id
 
-    def set_property(self, property_name, property_value):
-        setattr(self, property_name, property_value)
+    def freeze(self):
+        """
+        Keep the names of each property as an array of name ids, then the store is read-only
+        :return:
+        """
+        self.category_name_ids = [array('i', (self.name_ids[name] for name in record_ids))
+                                  for record_ids in self.category_record_ids]
+        self.frozen = True
+
+    def get_record(self, search_key, property_name='all_name'):
+        """
+        Get company record of a name by its record id
+        :param search_key: name
+        :param property_name: property name
+        :return: company record or {}
+        """
+        _code = self.category_codes.get(property_name)
+        if _code is None:
+            return {}
+        _record_id = self.category_record_ids[_code].get(search_key)
+        return self.records[_record_id] if _record_id is not None else {}
 
     def recursive_search_key_value(self, property_name, search_key):
         """
-        Recursive search key value in instance property that is a dict
+        Compatible with the former recursive search in dict properties, a name refers to its record by record id
         :param property_name: property name, string
         :param search_key: keyword for search
         :return: search result or {}
@@ -77,13 +186,118 @@ class Samples(object):
         assert isinstance(search_key, str) and str(
             search_key).strip(), f"Samples object property must be string and can't be empty"
 
-        _sample_obj_property = self.get_property(property_name).get(search_key, {})
+        return self.get_record(search_key, property_name)
 
-        if not _sample_obj_property or _sample_obj_property.get('termination'):
-            return _sample_obj_property
-        else:
-            _property_name, _search_key = list(_sample_obj_property.items())[0]
-            return self.recursive_search_key_value(_property_name, _search_key)
+    def build_index(self):
+        """
+        Tokenize full names and build n-gram index of every full name and abbreviation property for similarity
+        match. Abbreviation is indexed by character n-gram, full name is indexed by jieba token id n-gram.
+        :return:
+        """
+        self.ngram_index = {}
+        self.lsh_index = {}
+        self.symmetric_delete_index = {}
+        for search_type in self.search_types:
+            self.get_index(f'{search_type}_full_name')
+            self.get_index(f'{search_type}_abbr_name')
+            if FULL_NAME_LSH:
+                self.get_lsh_index(f'{search_type}_full_name')
+            if ABBR_EDIT_DISTANCE:
+                self.get_symmetric_delete_index(f'{search_type}_abbr_name')
+
+    def get_index(self, property_name):
+        """
+        Get n-gram index of property, build it if it doesn't exist
+        :param property_name: full name or abbreviation property name
+        :return: instance of NGramIndex
+        """
+        if self.ngram_index is None:
+            self.ngram_index = {}
+
+        _index = self.ngram_index.get(property_name)
+        if _index is None:
+            if property_name.endswith('_full_name'):
+                _index = NGramIndex(FULL_NGRAM_SIZE)
+                for name in self.get_property_names(property_name):
+                    _index.add(name, self.get_name_token_ids(name))
+            else:
+                _index = NGramIndex(ABBR_NGRAM_SIZE)
+                for name in self.get_property_names(property_name):
+                    _index.add(name, name)
+            self.ngram_index[property_name] = _index
+        return _index
+
+    def get_lsh_index(self, property_name):
+        """
+        Get MinHash LSH index of full name property, build it if it doesn't exist.
+        The position of names is same as n-gram index, the element set of a name is its jieba token ids.
+        :param property_name: full name property name
+        :return: instance of MinHashLSHIndex
+        """
+        if self.lsh_index is None:
+            self.lsh_index = {}
+
+        _index = self.lsh_index.get(property_name)
+        if _index is None:
+            _index = MinHashLSHIndex(LSH_BANDS, LSH_ROWS)
+            for position, token_ids in enumerate(self.get_index(property_name).sequences):
+                _index.add(position, token_ids)
+            self.lsh_index[property_name] = _index
+        return _index
+
+    def get_symmetric_delete_index(self, property_name):
+        """
+        Get symmetric delete index of abbreviation property, build it if it doesn't exist.
+        The position of names is same as n-gram index.
+        :param property_name: abbreviation property name
+        :return: instance of SymmetricDeleteIndex
+        """
+        if self.symmetric_delete_index is None:
+            self.symmetric_delete_index = {}
+
+        _index = self.symmetric_delete_index.get(property_name)
+        if _index is None:
+            _index = SymmetricDeleteIndex(ABBR_EDIT_DISTANCE)
+            for position, name in enumerate(self.get_index(property_name).names):
+                _index.add(position, name)
+            self.symmetric_delete_index[property_name] = _index
+        return _index
+
+    def get_lsh_stats(self):
+        """
+        Get blocking statistics of MinHash LSH indexes that have been queried
+        :return: {property name: statistics}
+        """
+        return {property_name: _index.get_stats() for property_name, _index in (self.lsh_index or {}).items()
+                if _index.stats['queries']}
+
+    def get_name_token_ids(self, name):
+        """
+        Get jieba token ids of a name in Samples, segment it only once
+        :param name: full name in Samples
+        :return: tuple of token ids
+        """
+        if self.name_token_ids is None:
+            self.token_ids = {}
+            self.name_token_ids = {}
+
+        _token_ids = self.name_token_ids.get(name)
+        if _token_ids is None:
+            _token_ids = tuple(self.token_ids.setdefault(token, len(self.token_ids)) for token in cached_lcut(name))
+            self.name_token_ids[name] = _token_ids
+        return _token_ids
+
+    def encode_tokens(self, tokens):
+        """
+        Encode the jieba tokens of a query into token ids without changing the vocabulary.
+        The token that isn't in vocabulary gets a negative id, so it only equals the same unknown token.
+        :param tokens: list of jieba tokens
+        :return: tuple of token ids
+        """
+        _token_ids = self.token_ids or {}
+        _unknown_ids = {}
+        return tuple(_token_ids[token] if token in _token_ids else
+                     _unknown_ids.setdefault(token, -1 - len(_unknown_ids)) for token in tokens)
 
 
 def get_samples_object(row_object_iterator, **kwargs):
@@ -96,25 +310,14 @@ def get_samples_object(row_object_iterator, **kwargs):
     samples_instance = Samples()
     for row_object in row_object_iterator:
         samples_instance = add_sample_object_property(samples_instance, row_object, **kwargs)
+    samples_instance.freeze()
+    samples_instance.build_index()
     return samples_instance
 
 
 def get_name_type(row_object):
     _company_name = row_object.column_value.get('单位名称')
-    if re_bank(_company_name):
-        return 'bank'
-    elif re_appraisal_company(_company_name):
-        return 'insurance_appraisal'
-    elif re_economic_company(_company_name):
-        return 'insurance_economic'
-    elif re_agency_company(_company_name):
-        return 'insurance_agency'
-    elif re_sale_company(_company_name):
-        return 'insurance_sale'
-    elif re_insurance(_company_name):
-        return 'insurance_company'
-    else:
-        return 'related_institutions'
+    return classify_company_type(_company_name, mode='sample')[1]
 
 
 def simplify_company_name(full_name):
@@ -138,41 +341,26 @@ def add_sample_object_property(samples_object, row_object, **kwargs):
         _property_full_name = f'{_name_type}_full_name'
         _property_abbr_name = f'{_name_type}_abbr_name'
 
-        _property_name_value = samples_object.get_property(_property_name)
-        _property_full_name_value = samples_object.get_property(_property_full_name)
-        _property_abbr_name_value = samples_object.get_property(_property_abbr_name)
-
         # add source
-        _property_full_name_value[full_name] = {'termination': True,
-                                                'full_name': row_object.column_value.get('单位名称'),
-                                                'company_type': row_object.column_value.get('单位类别')}
-        samples_object.set_property(_property_full_name, _property_full_name_value)
+        samples_object.add_record(_property_full_name, full_name,
+                                  {'termination': True, 'full_name': row_object.column_value.get('单位名称'),
+                                   'company_type': row_object.column_value.get('单位类别')})
 
         # add source reference
-        _property_name_value[full_name] = {_property_full_name: full_name}
-        samples_object.set_property(_property_name, _property_name_value)
+        samples_object.add_alias(_property_name, full_name, _property_full_name, full_name)
+        samples_object.add_alias('all_full_name', full_name, _property_full_name, full_name)
+        samples_object.add_alias('all_name', full_name, _property_full_name, full_name)
 
-        samples_object.all_full_name[full_name] = {_property_full_name: full_name}
-        samples_object.all_name[full_name] = {_property_full_name: full_name}
-
-        _property_abbr_name_value[abbr_name] = {_property_full_name: full_name}
-        samples_object.set_property(_property_abbr_name, _property_abbr_name_value)
-
-        _property_name_value[abbr_name] = {_property_full_name: full_name}
-        samples_object.set_property(_property_name, _property_name_value)
-
-        samples_object.all_abbr_name[abbr_name] = {_property_full_name: full_name}
-        samples_object.all_name[abbr_name] = {_property_full_name: full_name}
+        samples_object.add_alias(_property_abbr_name, abbr_name, _property_full_name, full_name)
+        samples_object.add_alias(_property_name, abbr_name, _property_full_name, full_name)
+        samples_object.add_alias('all_abbr_name', abbr_name, _property_full_name, full_name)
+        samples_object.add_alias('all_name', abbr_name, _property_full_name, full_name)
 
         if brief_name != abbr_name:
-            _property_abbr_name_value[brief_name] = {_property_full_name: full_name}
-            samples_object.set_property(_property_abbr_name, _property_abbr_name_value)
-
-            _property_name_value[brief_name] = {_property_full_name: full_name}
-            samples_object.set_property(_property_name, _property_name_value)
-
-            samples_object.all_abbr_name[brief_name] = {_property_full_name: full_name}
-            samples_object.all_name[brief_name] = {_property_full_name: full_name}
+            samples_object.add_alias(_property_abbr_name, brief_name, _property_full_name, full_name)
+            samples_object.add_alias(_property_name, brief_name, _property_full_name, full_name)
+            samples_object.add_alias('all_abbr_name', brief_name, _property_full_name, full_name)
+            samples_object.add_alias('all_name', brief_name, _property_full_name, full_name)
 
         return samples_object
     except Exception as e:
@@ -0,0 +1,126 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+NGramIndex.search and SymmetricDeleteIndex.lookup must return the same names as exhaustive scans
+
+python3.9 -m pytest test_samples_index.py
+"""
+
+import os
+import sys
+import difflib
+import random
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from samples_index import NGramIndex, SymmetricDeleteIndex
+
+# Few distinct characters make many names share n-grams and tie on ratio
+ALPHABET = '中国人寿保险北京分公司'
+SEED = 20210214
+
+
+def get_random_names(_random, count, min_length=1, max_length=8):
+    return [''.join(_random.choice(ALPHABET) for _ in range(_random.randint(min_length, max_length)))
+            for _ in range(count)]
+
+
+def scan_search(sequences, sequence, min_score=0, positions=None):
+    """
+    Compare with every name in order, the first name of maximum ratio wins
+    :return: maximum ratio, position; or 0, None if no ratio is greater than min_score
+    """
+    _best = (0, None)
+    for position in sorted(positions) if positions is not None else range(len(sequences)):
+        _ratio = difflib.SequenceMatcher(None, sequence, sequences[position]).ratio()
+        if _ratio > min_score and _ratio > _best[0]:
+            _best = (_ratio, position)
+    return _best
+
+
+def get_levenshtein_distance(a, b):
+    _previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        _current = [i]
+        for j, char_b in enumerate(b, start=1):
+            _current.append(min(_previous[j] + 1, _current[j - 1] + 1, _previous[j - 1] + (char_a != char_b)))
+        _previous = _current
+    return _previous[-1]
+
+
+class NGramIndexTest(unittest.TestCase):
+
+    def check_search(self, names, queries, n, to_sequence):
+        """
+        :param names: names in index
+        :param queries: query names
+        :param n: n-gram size
+        :param to_sequence: function that converts name to the sequence to compare
+        :return:
+        """
+        _random = random.Random(SEED + n)
+        _index = NGramIndex(n)
+        _sequences = [to_sequence(name) for name in names]
+        for name, sequence in zip(names, _sequences):
+            _index.add(name, sequence)
+
+        for query in queries:
+            _sequence = to_sequence(query)
+            _priority_positions = _random.sample(range(len(names)), 5)
+            _positions = _random.sample(range(len(names)), len(names) // 3)
+            for min_score in (0, 0.3, 0.5):
+                _ratio, _position = scan_search(_sequences, _sequence, min_score)
+                _expected = (_ratio, names[_position] if _position is not None else None)
+                with self.subTest(n=n, query=query, min_score=min_score):
+                    self.assertEqual(_expected, _index.search(_sequence, min_score))
+                    self.assertEqual(_expected, _index.search(_sequence, min_score,
+                                                              priority_positions=_priority_positions))
+
+                _ratio, _position = scan_search(_sequences, _sequence, min_score, _positions)
+                _expected = (_ratio, names[_position] if _position is not None else None)
+                with self.subTest(n=n, query=query, min_score=min_score, positions=True):
+                    self.assertEqual(_expected, _index.search(_sequence, min_score, positions=_positions))
+                    self.assertEqual(_expected, _index.search(_sequence, min_score, positions=_positions,
+                                                              priority_positions=_priority_positions))
+
+    def test_search_characters(self):
+        _random = random.Random(SEED)
+        _names = get_random_names(_random, 300)
+        _queries = get_random_names(_random, 40) + _random.sample(_names, 10) + ['', '中']
+        for n in (1, 2, 3):
+            self.check_search(_names, _queries, n, str)
+
+    def test_search_tokens(self):
+        _random = random.Random(SEED)
+        _names = get_random_names(_random, 300)
+        _queries = get_random_names(_random, 40) + _random.sample(_names, 10)
+        # Sequences of token ids like jieba tokens of Samples, every two characters are one token
+        _tokens = {}
+
+        def to_token_ids(name):
+            return tuple(_tokens.setdefault(name[i:i + 2], len(_tokens)) for i in range(0, len(name), 2))
+
+        for n in (1, 2, 3):
+            self.check_search(_names, _queries, n, to_token_ids)
+
+
+class SymmetricDeleteIndexTest(unittest.TestCase):
+
+    def test_lookup(self):
+        _random = random.Random(SEED)
+        _names = get_random_names(_random, 300, max_length=6)
+        _queries = get_random_names(_random, 60, max_length=6) + _random.sample(_names, 10)
+        for max_distance in (1, 2):
+            _index = SymmetricDeleteIndex(max_distance)
+            for position, name in enumerate(_names):
+                _index.add(position, name)
+            for query in _queries:
+                _distances = [(get_levenshtein_distance(query, name), position) for position, name in enumerate(_names)]
+                _expected = [position for distance, position in sorted(_distances) if distance <= max_distance]
+                with self.subTest(max_distance=max_distance, query=query):
+                    self.assertEqual(_expected, _index.lookup(query))
+
+
+if __name__ == "__main__":
+    unittest.main()
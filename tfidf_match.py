@@ -0,0 +1,157 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Vectorized similarity match engine, sparse TF-IDF of character n-grams and cosine similarity
+"""
+
+import math
+import threading
+import numpy as np
+from scipy import sparse
+from settings import TFIDF_NGRAM_RANGE, TFIDF_CHUNK_SIZE
+
+
+def get_char_ngrams(name, ngram_range=TFIDF_NGRAM_RANGE):
+    """
+    Get character n-grams of name
+    :param name: company name
+    :param ngram_range: (min n, max n)
+    :return: list of n-grams
+    """
+    _min_n, _max_n = ngram_range
+    return [name[i:i + n] for n in range(_min_n, _max_n + 1) for i in range(len(name) - n + 1)]
+
+
+class TfidfMatchEngine(object):
+    """
+    Match a batch of company names with the names of Samples property by one sparse matrix product.
+    The cosine similarity lies in [0, 1] like SequenceMatcher ratio, so the similarity bands are reused.
+    """
+    name = 'tfidf'
+
+    def __init__(self, samples_object, ngram_range=TFIDF_NGRAM_RANGE, chunk_size=TFIDF_CHUNK_SIZE):
+        """
+        :param samples_object: instance of class Samples
+        :param ngram_range: (min n, max n) of character n-grams
+        :param chunk_size: number of query names in one matrix product
+        """
+        self.samples_object = samples_object
+        self.ngram_range = ngram_range
+        self.chunk_size = chunk_size
+        self.vocabulary = {}  # n-gram -> column
+        self.idf = None
+        self.max_idf = 0
+        self.matrix = {}  # Samples property name -> (names, TF-IDF matrix of names)
+        self.results = {}  # (Samples property name, company name) -> (similarity, Samples name)
+        self._lock = threading.Lock()
+        self.fit()
+
+    def __getstate__(self):
+        _state = dict(self.__dict__)
+        _state.pop('_lock')
+        return _state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def fit(self):
+        """
+        Build n-gram vocabulary and idf from all names of Samples
+        :return:
+        """
+        _document_frequency = {}
+        _names = self.samples_object.get_property('all_name').keys()
+        for name in _names:
+            for gram in set(get_char_ngrams(name, self.ngram_range)):
+                column = self.vocabulary.setdefault(gram, len(self.vocabulary))
+                _document_frequency[column] = _document_frequency.get(column, 0) + 1
+
+        _documents = len(_names)
+        _df = np.zeros(len(self.vocabulary), dtype=np.float64)
+        for column, frequency in _document_frequency.items():
+            _df[column] = frequency
+        # smooth idf, as if a document contains every n-gram
+        self.idf = np.log((1 + _documents) / (1 + _df)) + 1
+        self.max_idf = math.log(1 + _documents) + 1
+
+    def transform(self, names):
+        """
+        Encode names as L2 normalized TF-IDF rows.
+        The n-gram that isn't in vocabulary has no column but still counts in the norm with maximum idf,
+        so an unknown query doesn't look similar to the Samples.
+        :param names: list of names
+        :return: csr matrix, shape (len(names), len(vocabulary))
+        """
+        _data, _indices, _indptr = [], [], [0]
+        for name in names:
+            _counts = {}
+            _unknown_square = 0
+            for gram in get_char_ngrams(name, self.ngram_range):
+                _counts[gram] = _counts.get(gram, 0) + 1
+            _row = {}
+            for gram, count in _counts.items():
+                column = self.vocabulary.get(gram)
+                if column is None:
+                    _unknown_square += (count * self.max_idf) ** 2
+                else:
+                    _row[column] = count * self.idf[column]
+            _norm = math.sqrt(sum(value * value for value in _row.values()) + _unknown_square) or 1.0
+            for column, value in _row.items():
+                _indices.append(column)
+                _data.append(value / _norm)
+            _indptr.append(len(_indices))
+        return sparse.csr_matrix((np.array(_data, dtype=np.float64), np.array(_indices, dtype=np.int64),
+                                  np.array(_indptr, dtype=np.int64)), shape=(len(names), len(self.vocabulary)))
+
+    def get_matrix(self, property_name):
+        """
+        Get names and transposed TF-IDF matrix of Samples property
+        :param property_name: full name or abbreviation property name
+        :return: list of names, csc matrix
+        """
+        with self._lock:
+            _matrix = self.matrix.get(property_name)
+            if _matrix is None:
+                _names = list(self.samples_object.get_property(property_name).keys())
+                _matrix = (_names, self.transform(_names).T.tocsc())
+                self.matrix[property_name] = _matrix
+            return _matrix
+
+    def prepare(self, property_name, company_names):
+        """
+        Match a batch of company names with Samples property, and keep the results for search
+        :param property_name: full name or abbreviation property name
+        :param company_names: list of company names
+        :return:
+        """
+        _names, _matrix = self.get_matrix(property_name)
+        _company_names = list(company_names)
+        if not _names:
+            self.results.update({(property_name, name): (0, None) for name in _company_names})
+            return
+
+        for start in range(0, len(_company_names), self.chunk_size):
+            _chunk = _company_names[start:start + self.chunk_size]
+            _similarity = self.transform(_chunk).dot(_matrix).tocsr()
+            _max = _similarity.max(axis=1).toarray().ravel()
+            _argmax = np.asarray(_similarity.argmax(axis=1)).ravel()
+            for name, similarity, position in zip(_chunk, _max, _argmax):
+                self.results[(property_name, name)] = (min(float(similarity), 1.0),
+                                                      _names[position] if similarity > 0 else None)
+
+    def search(self, property_name, company_name, min_score=0):
+        """
+        Get the most similar name in Samples property, match it if it isn't prepared
+        :param property_name: full name or abbreviation property name
+        :param company_name: company name
+        :param min_score: the minimum useful similarity
+        :return: similarity, the most similar name; or 0, None if no similarity is greater than min_score
+        """
+        _result = self.results.get((property_name, company_name))
+        if _result is None:
+            self.prepare(property_name, [company_name])
+            _result = self.results[(property_name, company_name)]
+        if _result[0] <= min_score:
+            return 0, None
+        return _result
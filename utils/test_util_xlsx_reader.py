@@ -0,0 +1,156 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+ProjectedXLSX must read the same rows as read-only HandleXLSX (openpyxl read-only workbook with data_only)
+
+python3.9 -m pytest utils/test_util_xlsx_reader.py
+"""
+
+import os
+import sys
+import re
+import shutil
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook
+from utils.util_xlsx import HandleXLSX
+from utils.util_xlsx_reader import ProjectedXLSX
+
+SHARED_STRINGS = ('公司', '日期', '是否', '公式', '备注', '数量', '编号', '  北京某某有限公司  ')
+
+# Style 1 is the date style of the cell written by openpyxl in build_workbook
+SHEET_DATA = (
+    '<sheetData>'
+    '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="s"><v>2</v></c>'
+    '<c r="D1" t="s"><v>3</v></c><c r="E1" t="s"><v>4</v></c><c r="F1" t="s"><v>5</v></c>'
+    '<c r="G1" t="s"><v>6</v></c></row>'
+    '<row r="2"><c r="A2" t="s"><v>7</v></c><c r="B2" s="1"><v>44197</v></c><c r="C2" t="b"><v>1</v></c>'
+    '<c r="D2"><f>F2*2</f><v>6</v></c><c r="E2" t="str"><f>"a"&amp;"b"</f><v>ab</v></c><c r="F2"><v>3</v></c></row>'
+    '<row r="4"><c r="C4" t="b"><v>0</v></c><c r="F4"><v>2.5</v></c></row>'
+    '<row><c t="inlineStr"><is><t>上海某某公司</t></is></c><c s="1"><v>44198.5</v></c></row>'
+    '<row r="6"/>'
+    '<row r="8"><c r="A8" t="inlineStr"><is><r><t>富</t></r><r><t>文本公司</t></r></is></c>'
+    '<c r="D8" t="e"><f>1/0</f><v>#DIV/0!</v></c><c r="F8"><v>1E3</v></c><c r="G8"><v>7</v></c></row>'
+    '<row r="9"><c r="B9" s="1"/><c r="D9"><f>F9+1</f></c></row>'
+    '</sheetData>'
+)
+
+
+def build_workbook(file_name, dimension):
+    """
+    Write a workbook by openpyxl, then replace its sheet data by SHEET_DATA and add shared strings
+    :param file_name: output file name
+    :param dimension: dimension reference of sheet, e.g. 'A1:C3', None means no dimension element
+    :return:
+    """
+    _work_book = Workbook()
+    _sheet = _work_book.active
+    _sheet.title = 'listing'
+    _sheet['B2'] = datetime(2021, 1, 1)
+    _work_book.create_sheet('other')
+    _template_name = file_name + '.template'
+    _work_book.save(_template_name)
+
+    _shared_strings = ''.join(f'<si><t xml:space="preserve">{value}</t></si>' for value in SHARED_STRINGS)
+    with zipfile.ZipFile(_template_name) as source, zipfile.ZipFile(file_name, 'w') as target:
+        for item in source.infolist():
+            _data = source.read(item.filename).decode('utf-8')
+            if item.filename == 'xl/worksheets/sheet1.xml':
+                assert re.search(r'<c r="B2" s="1"', _data), "date style of B2 must be 1"
+                _dimension = f'<dimension ref="{dimension}" />' if dimension else ''
+                _data = re.sub(r'<dimension [^>]*/>', _dimension, _data)
+                _data = re.sub(r'<sheetData>.*</sheetData>', SHEET_DATA, _data, flags=re.S)
+            elif item.filename == '[Content_Types].xml':
+                _data = _data.replace('</Types>', '<Override PartName="/xl/sharedStrings.xml" ContentType='
+                                                  '"application/vnd.openxmlformats-officedocument.spreadsheetml.'
+                                                  'sharedStrings+xml"/></Types>')
+            elif item.filename == 'xl/_rels/workbook.xml.rels':
+                _data = _data.replace('</Relationships>', '<Relationship Id="rIdStrings" Target="sharedStrings.xml" '
+                                                          'Type="http://schemas.openxmlformats.org/officeDocument/'
+                                                          '2006/relationships/sharedStrings"/></Relationships>')
+            target.writestr(item, _data)
+        target.writestr('xl/sharedStrings.xml',
+                        '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                        f'count="{len(SHARED_STRINGS)}" uniqueCount="{len(SHARED_STRINGS)}">{_shared_strings}</sst>')
+    os.remove(_template_name)
+
+
+class ProjectedXLSXTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assert_same_rows(self, file_name, columns=None):
+        """
+        :param file_name: Excel file name
+        :param columns: requested column names of ProjectedXLSX
+        :return:
+        """
+        _source_xls = HandleXLSX(file_name, 'listing', read_only=True)
+        _projected_xls = ProjectedXLSX(file_name, 'listing', columns=columns)
+        try:
+            self.assertEqual(_source_xls.get_dimensions(), _projected_xls.get_dimensions())
+            self.assertEqual(_source_xls.get_column_name_list(), _projected_xls.get_column_name_list())
+            self.assertEqual(list(_source_xls.sheet.iter_rows(values_only=True)),
+                             list(_projected_xls.sheet.iter_rows(values_only=True)))
+
+            _source_rows = list(_source_xls.generate_row_object_iterator(False))
+            _projected_rows = list(_projected_xls.generate_row_object_iterator(False))
+            self.assertEqual([row.position for row in _source_rows], [row.position for row in _projected_rows])
+            for source_row, projected_row in zip(_source_rows, _projected_rows):
+                self.assertEqual(source_row.column_name, projected_row.column_name)
+                for column_name, value in projected_row.column_value.items():
+                    _source_value = source_row.column_value.get(column_name)
+                    self.assertEqual((type(_source_value), _source_value), (type(value), value),
+                                     f'row {projected_row.position} column {column_name}')
+                if columns is None:
+                    self.assertEqual(source_row.row_value, projected_row.row_value)
+        finally:
+            _source_xls.close()
+            _projected_xls.close()
+
+    def check_dimension(self, dimension):
+        _file_name = os.path.join(self.directory, 'source.xlsx')
+        build_workbook(_file_name, dimension)
+        for columns in (None, ['公司'], ['数量', '是否'], ['日期', '公式', '备注']):
+            with self.subTest(dimension=dimension, columns=columns):
+                self.assert_same_rows(_file_name, columns)
+
+    def test_correct_dimension(self):
+        self.check_dimension('A1:G9')
+
+    def test_wrong_dimension(self):
+        self.check_dimension('A1:C3')
+
+    def test_no_dimension(self):
+        self.check_dimension(None)
+
+    def test_row_values(self):
+        _file_name = os.path.join(self.directory, 'source.xlsx')
+        build_workbook(_file_name, 'A1:G9')
+        _projected_xls = ProjectedXLSX(_file_name, 'listing')
+        _rows = {row.position: row.column_value for row in _projected_xls.generate_row_object_iterator(False)}
+        _projected_xls.close()
+        self.assertEqual(list(_rows), list(range(2, 10)))
+        self.assertEqual(_rows[2], {'公司': '北京某某有限公司', '日期': datetime(2021, 1, 1), '是否': True,
+                                    '公式': 6, '备注': 'ab', '数量': 3, '编号': None})
+        self.assertEqual(_rows[3], dict.fromkeys(_rows[3]))
+        self.assertEqual(_rows[4]['是否'], False)
+        self.assertEqual(_rows[5]['公司'], '上海某某公司')
+        self.assertEqual(_rows[5]['日期'], datetime(2021, 1, 2, 12))
+        self.assertEqual(_rows[8]['公司'], '富文本公司')
+        self.assertEqual(_rows[8]['公式'], '#DIV/0!')
+        self.assertEqual(_rows[8]['数量'], 1000)
+        self.assertEqual(_rows[8]['编号'], 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
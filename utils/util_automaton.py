@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+__author__ = 'shijin'
+"""
+Multi-pattern keyword automaton (Aho-Corasick)
+"""
+import collections
+
+
+class KeywordAutomaton(object):
+    """
+    Aho-Corasick automaton, locates all keywords in a text by one left-to-right pass
+    """
+
+    def __init__(self, words=None):
+        """
+        :param words: iterable of keywords
+        """
+        self._goto = [{}]  # state -> {character: next state}
+        self._fail = [0]  # state -> fail state
+        self._keyword = [None]  # state -> keyword whose last character is the state
+        self._output = [()]  # state -> keywords that end at the state, longest first, computed by build()
+        self._built = False
+        self.words = []
+        for word in words or ():
+            self.add(word)
+        self.build()
+
+    def __len__(self):
+        return len(self.words)
+
+    def add(self, word):
+        """
+        Add a keyword, build() must be called before matching
+        :param word: keyword, empty string is ignored
+        :return:
+        """
+        _word = str(word)
+        if not _word:
+            return
+        state = 0
+        for char in _word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._keyword.append(None)
+                self._output.append(())
+            state = next_state
+        if self._keyword[state] is None:
+            self._keyword[state] = _word
+            self.words.append(_word)
+            self._built = False
+
+    def build(self):
+        """
+        Build fail links and outputs by breadth-first search, outputs are recomputed from the keywords of states
+        so build() can be called again after add()
+        :return:
+        """
+        self._output = [(word,) if word is not None else () for word in self._keyword]
+        queue = collections.deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._built = True
+
+    def iter_matches(self, text):
+        """
+        Iterate all keyword matches in text, overlapping matches included
+        :param text: text
+        :return: iterator of (start, end, keyword), in order of end, the longer keyword first
+        """
+        if not self._built:
+            self.build()
+        _goto = self._goto
+        _fail = self._fail
+        _output = self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in _goto[state]:
+                state = _fail[state]
+            state = _goto[state].get(char, 0)
+            for word in _output[state]:
+                yield index + 1 - len(word), index + 1, word
+
+    def find_all(self, text):
+        """
+        :param text: text
+        :return: list of (start, end, keyword), overlapping matches included
+        """
+        return list(self.iter_matches(text))
+
+    def find_leftmost_longest(self, text):
+        """
+        Find non-overlapping keywords, the leftmost keyword wins, then the longest one
+        :param text: text
+        :return: list of (start, end, keyword), in order of start
+        """
+        _matches = sorted(self.iter_matches(text), key=lambda match: (match[0], -match[1]))
+        _result = []
+        _end = 0
+        for start, end, word in _matches:
+            if start >= _end:
+                _result.append((start, end, word))
+                _end = end
+        return _result
+
+    def contains(self, text):
+        """
+        :param text: text
+        :return: True if text includes any keyword
+        """
+        for _ in self.iter_matches(text):
+            return True
+        return False
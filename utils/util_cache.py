@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+__author__ = 'shijin'
+"""
+Cache tools
+"""
+import collections
+import threading
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """
+    Thread-safe bounded cache, evicts the least recently used key
+    """
+
+    def __init__(self, max_size=10000):
+        """
+        :param max_size: maximum number of keys, 0 or None means the cache is disabled
+        """
+        self.max_size = max_size or 0
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """
+        Get value of key and mark it as recently used
+        :param key:
+        :param default: returned if key doesn't exist
+        :return:
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Set value of key, evict the least recently used key if cache is full
+        :param key:
+        :param value:
+        :return:
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, func, *args, **kwargs):
+        """
+        Get value of key, call func to get value and set it if key doesn't exist
+        :param key:
+        :param func: function that returns value of key
+        :param args: args of func
+        :param kwargs: kwargs of func
+        :return:
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = func(*args, **kwargs)
+            self.set(key, value)
+        return value
+
+    def after_fork(self):
+        """
+        Recreate lock in child process, the lock copied by fork may be held by a thread that doesn't exist in child
+        :return:
+        """
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Get cache statistics
+        :return: dict of size, hits, misses and hit rate
+        """
+        _total = self.hits + self.misses
+        return {'size': len(self._data), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / _total, 4) if _total else 0}
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+__author__ = 'shijin'
+"""
+jieba tools, bounded segmentation cache shared by all call sites
+"""
+import os
+import time
+import jieba
+from utils.util_cache import LRUCache
+from utils.util_hash import get_file_md5
+from utils.util_readfile import stream_iterator
+from utils.util_logfile import nlogger
+from settings import JIEBA_CACHE_SIZE, JIEBA_HMM, JIEBA_DICT_FILE, JIEBA_CACHE_FILE
+
+# (text, mode) -> tuple of tokens
+_segment_cache = LRUCache(JIEBA_CACHE_SIZE)
+# (jieba dictionary file, its md5), the loaded dictionary file is hashed once
+_dictionary_md5 = (None, None)
+
+
+def init_jieba(dict_file=JIEBA_DICT_FILE, cache_file=JIEBA_CACHE_FILE):
+    """
+    Load jieba dictionary eagerly instead of on the first segmentation.
+    The prebuilt dictionary is used if it exists, its prefix dictionary model is loaded from cache_file.
+    :param dict_file: prebuilt dictionary file, None means jieba default dictionary
+    :param cache_file: serialized prefix dictionary model of dict_file
+    :return: seconds of loading
+    """
+    _start = time.time()
+    if dict_file and os.path.exists(dict_file):
+        if jieba.dt.dictionary != os.path.abspath(dict_file):
+            jieba.set_dictionary(dict_file)
+            # The cached tokens were cut by another dictionary
+            _segment_cache.clear()
+        jieba.dt.cache_file = os.path.abspath(cache_file)
+    else:
+        nlogger.warning(f'init_jieba: {dict_file} does not exist, use jieba default dictionary')
+    jieba.dt.check_initialized()
+    _seconds = time.time() - _start
+    nlogger.info(f'init_jieba: dictionary {jieba.dt.dictionary or "default"}, {len(jieba.dt.FREQ)} words, '
+                 f'{_seconds:.3f}s')
+    return _seconds
+
+
+def get_dictionary_fingerprint():
+    """
+    Fingerprint of jieba segmentation, the tokens of a text are same if the fingerprint is same
+    :return: string of dictionary md5 and HMM mode
+    """
+    global _dictionary_md5
+    _dictionary = jieba.dt.dictionary
+    if not _dictionary:
+        _md5 = 'default'
+    elif _dictionary_md5[0] == _dictionary:
+        _md5 = _dictionary_md5[1]
+    else:
+        _md5 = get_file_md5(_dictionary, stream_iterator)
+        _dictionary_md5 = (_dictionary, _md5)
+    return f'{_md5}:{"hmm" if JIEBA_HMM else "no_hmm"}'
+
+
+def cached_lcut(text, cut_all=False, hmm=None):
+    """
+    Segment text by jieba, the result is cached by (text, mode)
+    :param text: text
+    :param cut_all: jieba full mode
+    :param hmm: use HMM model to find new words, default is JIEBA_HMM. It's ignored in full mode
+    :return: tuple of tokens
+    """
+    _hmm = JIEBA_HMM if hmm is None else hmm
+    if cut_all:
+        _mode = 'cut_all'
+    else:
+        _mode = 'hmm' if _hmm else 'no_hmm'
+    return _segment_cache.get_or_set((text, _mode), _cut, text, cut_all, _hmm)
+
+
+def _cut(text, cut_all, hmm):
+    return tuple(jieba.cut(text, cut_all=cut_all, HMM=hmm))
+
+
+def get_cache_stats():
+    """
+    :return: dict of size, hits, misses and hit rate of segmentation cache
+    """
+    return _segment_cache.stats()
+
+
+def clear_cache():
+    _segment_cache.clear()
+
+
+def set_cache_size(max_size):
+    """
+    Resize segmentation cache, the cached results are dropped
+    :param max_size: maximum number of cached texts, 0 means the cache is disabled
+    :return:
+    """
+    global _segment_cache
+    _segment_cache = LRUCache(max_size)
+
+
+# The lock may be held by another thread of parent process when fork, the child process must not inherit it
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: _segment_cache.after_fork())
@@ -9,6 +9,32 @@ from datetime import datetime, date
 import os
 import re
 
+# Compiled patterns, name -> pattern, compiled once at import
+RE_PATTERNS = {
+    'mail': re.compile('[\w]+[\-\w.]*@[0-9a-zA-Z]{1,13}\.[com,cn,net]{1,3}$', flags=re.I),  # 邮件正则
+    'mobile': re.compile('^[1][3,4,5,7,8][0-9]{9}$'),  # 手机号正则
+    'uid': re.compile('[\w.]*uid$', flags=re.I),  # UID正则
+    'duid': re.compile('^hc(pd|vd|cloud|dev){1}[\w]{21,24}$', flags=re.I),  # 设备唯一标识正则
+    'ip': re.compile(r'^(([1-9]?\d|1\d\d|2[0-4]\d|25[0-5])\.){3}([1-9]?\d|1\d\d|2[0-4]\d|25[0-5])$'),
+    'like_ip': re.compile(r'^(([1-9]?\d|1\d\d|2[0-4]\d|25[0-5])\.)+\d*'),
+    'abbreviation': re.compile(r'^[a-z0-9]([-a-z0-9]*[a-z0-9])?$'),  # 英文缩写标识正则
+    'domain': re.compile(r'(?:[A-Z0-9_](?:[A-Z0-9-_]{0,247}[A-Z0-9])?\.)+(?:[A-Z]{2,6}|[A-Z0-9-]{2,}(?<!-))\Z',
+                         re.IGNORECASE),
+    'url': re.compile(r'^https?:/{2}\w.+$', re.IGNORECASE),
+    'ipv4': re.compile(r'(?:25[0-5]|2[0-4]\d|[0-1]?\d?\d)(?:\.(?:25[0-5]|2[0-4]\d|[0-1]?\d?\d)){3}', re.IGNORECASE),
+    'like_bank': re.compile(r'^.*(银行)+(?!保险)'),
+    'bank': re.compile(r'^.*(银行)+(?!保险)'),
+    'company': re.compile(r'^.*(公司)+$'),
+    'like_insurance': re.compile(r'^.*(保|险)+'),
+    'insurance': re.compile(r'^.*(保险)+'),
+    'economic_company': re.compile(r'^.*(经纪)+'),
+    'agency_company': re.compile(r'^.*(代理)+'),
+    'sale_company': re.compile(r'^.*(销售)+'),
+    'appraisal_company': re.compile(r'^.*(公估)+'),
+    'remove_sub_company': re.compile(r'^.{4,}(支|分)+'),
+    'full_company_name': re.compile(r'^.*(公司|银行|集团)+$'),
+}
+
 
 def datetime_verify(value):
     """判断是否是一个有效的日期字符串"""
@@ -52,24 +78,20 @@ def datetime_verify(value):
 
 def re_mail(mail):
     if isinstance(mail, (str,)):
-        _re_mail = re.compile('[\w]+[\-\w.]*@[0-9a-zA-Z]{1,13}\.[com,cn,net]{1,3}$', flags=re.I)  # 邮件正则
-        return _re_mail.match(mail)
+        return RE_PATTERNS['mail'].match(mail)
     elif isinstance(mail, (bytes,)):
         mail = str(mail, encoding='utf-8')
-        _re_mail = re.compile('[\w]+[\-\w.]*@[0-9a-zA-Z]{1,13}\.[com,cn,net]{1,3}$', flags=re.I)  # 邮件正则
-        return _re_mail.match(mail)
+        return RE_PATTERNS['mail'].match(mail)
     else:
         return
 
 
 def re_mobile(mobile):
     if isinstance(mobile, (str,)):
-        _re_mobile = re.compile('^[1][3,4,5,7,8][0-9]{9}$')  # 手机号正则
-        return _re_mobile.match(mobile)
+        return RE_PATTERNS['mobile'].match(mobile)
     elif isinstance(mobile, (bytes,)):
         mobile = str(mobile, encoding='utf-8')
-        _re_mobile = re.compile('^[1][3,4,5,7,8][0-9]{9}$')  # 手机号正则
-        return _re_mobile.match(mobile)
+        return RE_PATTERNS['mobile'].match(mobile)
     else:
         return
 
@@ -77,8 +99,7 @@ def re_mobile(mobile):
 def re_uid(uidstr):
     """ check string is *uid"""
     if isinstance(uidstr, (str,)):
-        _re_uid = re.compile('[\w.]*uid$', flags=re.I)  # UID正则
-        return _re_uid.match(uidstr)
+        return RE_PATTERNS['uid'].match(uidstr)
 
 
 def isdigit(number):
@@ -93,20 +114,17 @@ def re_duid(duid):
     if isinstance(duid, (str,)):
         if len(duid) != 28:
             return None
-        _re_duid = re.compile('^hc(pd|vd|cloud|dev){1}[\w]{21,24}$', flags=re.I)  # 设备唯一标识正则
-        return _re_duid.match(duid)
+        return RE_PATTERNS['duid'].match(duid)
 
 
 def re_ip(ip):
     if isinstance(ip, (str,)):
-        _re_ip = re.compile(r'^(([1-9]?\d|1\d\d|2[0-4]\d|25[0-5])\.){3}([1-9]?\d|1\d\d|2[0-4]\d|25[0-5])$')
-        return _re_ip.match(ip)
+        return RE_PATTERNS['ip'].match(ip)
 
 
 def re_like_ip(ip):
     if isinstance(ip, (str,)):
-        _re_ip = re.compile(r'^(([1-9]?\d|1\d\d|2[0-4]\d|25[0-5])\.)+\d*')
-        return _re_ip.match(ip)
+        return RE_PATTERNS['like_ip'].match(ip)
 
 
 def is_emptystring(string):
@@ -121,14 +139,11 @@ def is_emptystring(string):
 
 def re_abbreviation(abbr):
     if isinstance(abbr, (str,)):
-        _re_abbreviation = re.compile(r'^[a-z0-9]([-a-z0-9]*[a-z0-9])?$')  # 英文缩写标识正则
-        return _re_abbreviation.match(abbr)
+        return RE_PATTERNS['abbreviation'].match(abbr)
 
 
 def is_domain(domain):
-    _re_domain = re.compile(r'(?:[A-Z0-9_](?:[A-Z0-9-_]{0,247}[A-Z0-9])?\.)+(?:[A-Z]{2,6}|[A-Z0-9-]{2,}(?<!-))\Z',
-                            re.IGNORECASE)
-    return _re_domain.match(domain)
+    return RE_PATTERNS['domain'].match(domain)
 
 
 # def is_url(url):
@@ -142,25 +157,21 @@ def is_domain(domain):
 
 def is_url(url):
     try:
-        url_regex = re.compile(r'^https?:/{2}\w.+$', re.IGNORECASE)
-        return True if url_regex.match(url) else False
+        return True if RE_PATTERNS['url'].match(url) else False
     except:
         return False
 
 
 def is_ipv4(address):
     try:
-        ipv4_regex = re.compile(r'(?:25[0-5]|2[0-4]\d|[0-1]?\d?\d)(?:\.(?:25[0-5]|2[0-4]\d|[0-1]?\d?\d)){3}',
-                                re.IGNORECASE)
-        return True if ipv4_regex.match(address) else False
+        return True if RE_PATTERNS['ipv4'].match(address) else False
     except:
         return False
 
 
 def re_like_bank(name):
     if isinstance(name, (str,)):
-        _re_bank = re.compile(r'^.*(银行)+(?!保险)')
-        return _re_bank.match(name)
+        return RE_PATTERNS['like_bank'].match(name)
 
 
 # def re_like_bank(name):
@@ -171,59 +182,80 @@ def re_like_bank(name):
 
 def re_bank(name):
     if isinstance(name, (str,)):
-        _re_bank = re.compile(r'^.*(银行)+(?!保险)')
-        return _re_bank.match(name)
+        return RE_PATTERNS['bank'].match(name)
 
 
 def re_company(name):
     if isinstance(name, (str,)):
-        _re_company = re.compile(r'^.*(公司)+$')
-        return _re_company.match(name)
+        return RE_PATTERNS['company'].match(name)
 
 
 def re_like_insurance(name):
     if isinstance(name, (str,)):
-        _re_insurance = re.compile(r'^.*(保|险)+')
-        return _re_insurance.match(name)
+        return RE_PATTERNS['like_insurance'].match(name)
 
 
 def re_insurance(name):
     if isinstance(name, (str,)):
-        _re_insurance = re.compile(r'^.*(保险)+')
-        return _re_insurance.match(name)
+        return RE_PATTERNS['insurance'].match(name)
 
 
 def re_economic_company(name):
     if isinstance(name, (str,)):
-        _re_economic_company = re.compile(r'^.*(经纪)+')
-        return _re_economic_company.match(name)
+        return RE_PATTERNS['economic_company'].match(name)
 
 
 def re_agency_company(name):
     if isinstance(name, (str,)):
-        _re_agency_company = re.compile(r'^.*(代理)+')
-        return _re_agency_company.match(name)
+        return RE_PATTERNS['agency_company'].match(name)
 
 
 def re_sale_company(name):
     if isinstance(name, (str,)):
-        _re_sale_company = re.compile(r'^.*(销售)+')
-        return _re_sale_company.match(name)
+        return RE_PATTERNS['sale_company'].match(name)
 
 
 def re_appraisal_company(name):
     if isinstance(name, (str,)):
-        _re_appraisal_company = re.compile(r'^.*(公估)+')
-        return _re_appraisal_company.match(name)
+        return RE_PATTERNS['appraisal_company'].match(name)
 
 
 def re_remove_sub_company(name):
     if isinstance(name, (str,)):
-        _re_compile = re.compile(r'^.{4,}(支|分)+')
-        return _re_compile.match(name)
+        return RE_PATTERNS['remove_sub_company'].match(name)
 
 
 def re_full_company_name(name):
     if isinstance(name, (str,)):
-        _re_full_company = re.compile(r'^.*(公司|银行|集团)+$')
-        return _re_full_company.match(name)
+        return RE_PATTERNS['full_company_name'].match(name)
+
+
+def re_match_batch(pattern_name, names):
+    """
+    Match a list of names with one compiled pattern
+    :param pattern_name: key of RE_PATTERNS, e.g. 'bank', 'insurance', 'remove_sub_company'
+    :param names: list of names
+    :return: list of match object, None if name doesn't match or isn't a string
+    """
+    _match = RE_PATTERNS[pattern_name].match
+    return [_match(name) if isinstance(name, str) else None for name in names]
+
+
+def re_classify_batch(names, pattern_names):
+    """
+    Classify a list of names by patterns in order, the first matched pattern wins
+    :param names: list of names
+    :param pattern_names: keys of RE_PATTERNS in order of priority
+    :return: list of the first matched pattern name, None if no pattern matches
+    """
+    _patterns = [(pattern_name, RE_PATTERNS[pattern_name].match) for pattern_name in pattern_names]
+    _result = []
+    for name in names:
+        _pattern_name = None
+        if isinstance(name, str):
+            for pattern_name, _match in _patterns:
+                if _match(name):
+                    _pattern_name = pattern_name
+                    break
+        _result.append(_pattern_name)
+    return _result
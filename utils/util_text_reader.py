@@ -0,0 +1,278 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+CSV, TSV and JSONL readers with the same row object iterator as HandleXLSX.
+A text file is a workbook of one sheet, row 1 is the column name row and the records are rows from 2.
+"""
+
+import os
+import sys
+import csv
+import json
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.util_xlsx_reader import ProjectedXLSX
+from settings import TEXT_ENCODING
+
+
+class TextReaderError(Exception):
+    pass
+
+
+class TextWorkbook(object):
+    """
+    Workbook of a text file, it has only one sheet titled by file name
+    """
+
+    def __init__(self, file_name, sheet_class, **kwargs):
+        """
+        :param file_name: text file name
+        :param sheet_class: CSVSheet or JSONLSheet
+        :param kwargs: kwargs of sheet_class
+        """
+        self.file_name = file_name
+        self._sheet = sheet_class(self, os.path.splitext(os.path.basename(file_name))[0], **kwargs)
+
+    @property
+    def worksheets(self):
+        return [self._sheet]
+
+    @property
+    def sheetnames(self):
+        return [self._sheet.title]
+
+    @property
+    def active(self):
+        return self._sheet
+
+    def __getitem__(self, sheet_name):
+        # A text file has one sheet, the sheet name of command line refers to it
+        return self._sheet
+
+    def close(self):
+        pass
+
+
+class TextSheet(object):
+    """
+    Sheet of a text file, records are parsed line by line in one pass and rows are never missing.
+    Dimensions are only known by scanning the file, so they are calculated on demand.
+    """
+
+    def __init__(self, parent, title, encoding=TEXT_ENCODING):
+        """
+        :param parent: instance of TextWorkbook
+        :param title: sheet title
+        :param encoding: file encoding, 'utf-8-sig' also reads the file with BOM
+        """
+        self.parent = parent
+        self.title = title
+        self.encoding = encoding
+        self._column_names = None
+        self._max_row = None
+
+    def iter_records(self):
+        """
+        :return: iterator of records after column name row, list of values or dict
+        """
+        raise NotImplementedError
+
+    def get_column_names(self):
+        raise NotImplementedError
+
+    def get_values(self, record, columns):
+        """
+        :param record: record of iter_records
+        :param columns: column numbers
+        :return: {column number: value}, columns that record doesn't have are left out
+        """
+        raise NotImplementedError
+
+    @property
+    def max_row(self):
+        if self._max_row is None:
+            self.calculate_dimension(force=True)
+        return self._max_row
+
+    @property
+    def max_column(self):
+        return len(self.get_column_names())
+
+    def calculate_dimension(self, force=False):
+        if self._max_row is None and force:
+            self._max_row = 1 + sum(1 for _ in self.iter_records())
+
+    def iter_projected_rows(self, columns=None, min_row=1, max_row=None):
+        """
+        :param columns: list of column numbers, None means all columns
+        :param min_row: the first row number
+        :param max_row: the last row number, None means the last record
+        :return: iterator of (row number, {column number: value})
+        """
+        _columns = list(columns) if columns is not None else list(range(1, self.max_column + 1))
+        if min_row <= 1 and (max_row is None or max_row >= 1):
+            yield 1, {column: self.get_column_names()[column - 1] for column in _columns
+                      if column <= self.max_column}
+        for row_number, record in enumerate(self.iter_records(), start=2):
+            if max_row is not None and row_number > max_row:
+                break
+            if row_number >= min_row:
+                yield row_number, self.get_values(record, _columns)
+
+    def iter_rows(self, min_row=None, max_row=None, min_col=None, max_col=None, values_only=True):
+        """
+        Rows of values like iter_rows of openpyxl worksheet, text sheet has no cell objects
+        :param min_row: the first row number, default 1
+        :param max_row: the last row number, default the last record
+        :param min_col: the first column number, default 1
+        :param max_col: the last column number, default the number of column names
+        :param values_only: always values
+        :return: iterator of tuples
+        """
+        _min_col = min_col or 1
+        _max_col = max_col or self.max_column
+        _columns = list(range(_min_col, _max_col + 1))
+        for row_number, values in self.iter_projected_rows(_columns, min_row or 1, max_row):
+            yield tuple(values.get(column) for column in _columns)
+
+
+class CSVSheet(TextSheet):
+    """
+    Sheet of CSV or TSV file, the first line is the column name row.
+    Values are text, an empty field is an empty cell (None) like Excel.
+    """
+
+    def __init__(self, parent, title, delimiter=',', **kwargs):
+        """
+        :param parent: instance of TextWorkbook
+        :param title: sheet title
+        :param delimiter: ',' for CSV, '\t' for TSV
+        :param kwargs:
+        """
+        super(CSVSheet, self).__init__(parent, title, **kwargs)
+        self.delimiter = delimiter
+
+    def iter_lines(self):
+        with open(self.parent.file_name, 'r', encoding=self.encoding, newline='') as f:
+            yield from csv.reader(f, delimiter=self.delimiter)
+
+    def get_column_names(self):
+        if self._column_names is None:
+            self._column_names = next(self.iter_lines(), [])
+        return self._column_names
+
+    def iter_records(self):
+        _lines = self.iter_lines()
+        next(_lines, None)
+        return _lines
+
+    def get_values(self, record, columns):
+        _length = len(record)
+        return {column: record[column - 1] or None for column in columns if column <= _length}
+
+
+class JSONLSheet(TextSheet):
+    """
+    Sheet of JSON Lines file, each line is an object and a key is a column.
+    The column names are the keys of the first object, row 1 is virtual. Blank lines are skipped.
+    Values keep their JSON types, an array or object value is kept as JSON text.
+    """
+
+    def iter_records(self):
+        with open(self.parent.file_name, 'r', encoding=self.encoding) as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    _record = json.loads(line)
+                except ValueError as e:
+                    raise TextReaderError(f'{self.parent.file_name} line {line_number} is not JSON: {e}')
+                if not isinstance(_record, dict):
+                    raise TextReaderError(f'{self.parent.file_name} line {line_number} is not a JSON object')
+                yield _record
+
+    def get_column_names(self):
+        if self._column_names is None:
+            self._column_names = list(next(self.iter_records(), {}).keys())
+        return self._column_names
+
+    def get_values(self, record, columns):
+        _column_names = self.get_column_names()
+        _values = {}
+        for column in columns:
+            if column <= len(_column_names) and _column_names[column - 1] in record:
+                value = record[_column_names[column - 1]]
+                _values[column] = json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+        return _values
+
+
+class HandleText(ProjectedXLSX):
+    """
+    Read-only reader of text file, yields the same row objects as HandleXLSX with the requested columns.
+    Written values are saved by StreamWorkbookWriter into an Excel of the text rows.
+    """
+    sheet_class = None
+    sheet_kwargs = {}
+
+    @property
+    def work_book(self):
+        return self._work_book
+
+    @work_book.setter
+    def work_book(self, file_name):
+        self._work_book = self.open_workbook(file_name)
+
+    @classmethod
+    def open_workbook(cls, file_name):
+        return TextWorkbook(file_name, cls.sheet_class, **cls.sheet_kwargs)
+
+    def get_rows_start_end(self, start_point=None, end_point=None, **kwargs):
+        """
+        Check the start and end points of rows, the file isn't scanned to count rows
+        :param start_point: >= 2, 1 is the column name row.
+        :param end_point: >= start_point, None means the last record, rows after the last record don't exist
+        :param kwargs:
+        :return: start and end points after verification, end point may be None
+        """
+        _points = []
+        for point in (start_point, end_point):
+            if point is None or isinstance(point, int):
+                _points.append(point)
+            elif isinstance(point, str):
+                assert point.strip().isdigit(), "Parameter start_point and end_point must be int"
+                _points.append(int(point))
+            else:
+                raise ValueError(f'{point} is invalid')
+        _start_point = max(_points[0] or 2, 2)
+        _end_point = _points[1]
+
+        assert _end_point is None or _start_point <= _end_point, \
+            "start_point is not less than 2, end_point must be more than or equal to start_point"
+        return _start_point, _end_point
+
+
+class HandleCSV(HandleText):
+    sheet_class = CSVSheet
+    sheet_kwargs = {'delimiter': ','}
+
+
+class HandleTSV(HandleText):
+    sheet_class = CSVSheet
+    sheet_kwargs = {'delimiter': '\t'}
+
+
+class HandleJSONL(HandleText):
+    sheet_class = JSONLSheet
+
+
+# File extension -> reader of text file
+TEXT_READERS = {'.csv': HandleCSV, '.tsv': HandleTSV, '.jsonl': HandleJSONL}
+
+
+def get_text_reader_class(file_name):
+    """
+    :param file_name: source file name
+    :return: reader class by file extension, or None if file isn't a text file
+    """
+    return TEXT_READERS.get(os.path.splitext(str(file_name))[1].lower())
@@ -46,24 +46,41 @@ class HandleXLSX(object):
     Class for handling Excel file
     """
 
-    def __init__(self, file_name, sheet_name=None, **kwargs):
+    def __init__(self, file_name, sheet_name=None, read_only=False, **kwargs):
         """
         :param file_name: The excel file name
         :param sheet_name: The sheet name in excel file
+        :param read_only: if read_only is True, rows are streamed from the file with constant memory,
+            cell values are the values that Excel calculated (data_only), written values are kept until save
         :param kwargs:
         """
         self._file_name = file_name
+        self._read_only = read_only
+        self._column_names = {}  # sheet title -> column name list
+        self._dimensions = {}  # sheet title -> (max row, max column)
+        self._pending_values = {}  # sheet title -> {row: {column: value}}, written values of read-only workbook
         self.work_book = self._file_name
         self.sheet = sheet_name
         self.row_title_list = []
 
+    @property
+    def file_name(self):
+        return self._file_name
+
+    @property
+    def read_only(self):
+        return self._read_only
+
     @property
     def work_book(self):
         return self._work_book
 
     @work_book.setter
     def work_book(self, file_name):
-        self._work_book = load_workbook(file_name)
+        if self._read_only:
+            self._work_book = load_workbook(file_name, read_only=True, data_only=True)
+        else:
+            self._work_book = load_workbook(file_name)
 
     @property
     def sheet(self):
@@ -78,11 +95,27 @@ class HandleXLSX(object):
 
     @property
     def max_column(self):
-        return self._sheet.max_column
+        return self.get_dimensions()[1]
 
     @property
     def max_row(self):
-        return self._sheet.max_row
+        return self.get_dimensions()[0]
+
+    def get_dimensions(self):
+        """
+        Get dimensions of current sheet, the dimensions of read-only sheet are cached.
+        If read-only sheet doesn't record its dimensions, the rows are scanned once.
+        :return: max row, max column
+        """
+        if not self._read_only:
+            return self._sheet.max_row, self._sheet.max_column
+
+        _title = self._sheet.title
+        if _title not in self._dimensions:
+            if not self._sheet.max_row or not self._sheet.max_column:
+                self._sheet.calculate_dimension(force=True)
+            self._dimensions[_title] = (self._sheet.max_row or 0, self._sheet.max_column or 0)
+        return self._dimensions[_title]
 
     def get_rows_start_end(self, start_point=None, end_point=None, **kwargs):
         """
@@ -215,6 +248,13 @@ class HandleXLSX(object):
         """
         if sheet_name:
             self.sheet = sheet_name
+        if self._read_only:
+            # The first row is parsed once, a copy is returned because callers may append column names
+            _title = self.sheet.title
+            if _title not in self._column_names:
+                _column_name_list = self.sheet.iter_rows(values_only=True).__next__()
+                self._column_names[_title] = [str(column_name).strip() for column_name in _column_name_list]
+            return list(self._column_names[_title])
         _column_name_list = self.sheet.iter_rows(values_only=True).__next__()
         # return list(_column_name_list)
         return [str(column_name).strip() for column_name in _column_name_list]
@@ -233,18 +273,54 @@ class HandleXLSX(object):
         assert isinstance(values, (list, tuple)), "values must be list or tuple"
         if len(values) == 3 and isinstance(values[0], int) and isinstance(values[1], int):
             # For example self.sheet.cell(1, 5, "哈哈哈")
-            self.sheet.cell(*values)
+            self.write_cell(*values)
         else:
             for cell in values:
                 assert isinstance(cell, (list, tuple)) and len(cell) == 3, "parameters must be x, y, value"
                 # x = cell[0]
                 # y = cell[1]
                 # value = cell[2]
-                self.sheet.cell(*cell)
+                self.write_cell(*cell)
 
         if auto_save is True:
             self.save()
 
+    def write_sheet_values(self, sheet_values, auto_save=False, **kwargs):
+        """
+        Write cell values of sheets, each sheet is looked up once and the values are written row by row
+        :param sheet_values: {sheet title: {row number: {column number: value}}}, numbers are from 1
+        :param auto_save:
+        :param kwargs:
+        :return:
+        """
+        for sheet_title, row_values in sheet_values.items():
+            if self._read_only:
+                _pending_values = self._pending_values.setdefault(sheet_title, {})
+                for row, values in row_values.items():
+                    _pending_values.setdefault(row, {}).update(values)
+                continue
+
+            _sheet = self._work_book[sheet_title]
+            for row, values in sorted(row_values.items()):
+                for column, value in values.items():
+                    _sheet.cell(row, column, value)
+
+        if auto_save is True:
+            self.save()
+
+    def write_cell(self, row, column, value=None):
+        """
+        Write value of a cell in current sheet, read-only workbook keeps it until save
+        :param row: row number, from 1
+        :param column: column number, from 1
+        :param value: cell value
+        :return:
+        """
+        if self._read_only:
+            self._pending_values.setdefault(self._sheet.title, {}).setdefault(row, {})[column] = value
+        else:
+            self._sheet.cell(row, column, value)
+
     def save(self, file_name=None):
         """
         save Excel File
@@ -253,7 +329,27 @@ class HandleXLSX(object):
         """
         # self._work_book.save('./123.xlsx')
         _file_name = str(file_name).strip() if file_name else self._file_name
-        self._work_book.save(_file_name)
+        if self._read_only:
+            self.save_streaming(_file_name)
+        else:
+            self._work_book.save(_file_name)
+
+    def save_streaming(self, file_name):
+        """
+        Save read-only workbook by StreamWorkbookWriter, the written values are merged into their rows
+        :param file_name: output file name, it can't be the source file of read-only workbook
+        :return:
+        """
+        StreamWorkbookWriter(self._file_name, self.open_workbook).save(file_name, self._pending_values)
+
+    @classmethod
+    def open_workbook(cls, file_name):
+        """
+        Open source file as a workbook whose rows are streamed, used by StreamWorkbookWriter
+        :param file_name: source file name
+        :return: read-only workbook
+        """
+        return load_workbook(file_name, read_only=True)
 
     def close(self):
         self._work_book.close()
@@ -288,6 +384,64 @@ class HandleXLSX(object):
             self.prepare_write_value(download_result, result)
 
 
+class StreamWorkbookWriter(object):
+    """
+    Write a copy of source Excel by write-only workbook with some cell values replaced.
+    Rows of every sheet are streamed from source and appended in order, the new values are merged into their rows,
+    so memory stays flat and saving costs in proportion to the output. Only values are copied, styles are not.
+    """
+
+    def __init__(self, source_file_name, open_workbook=None):
+        """
+        :param source_file_name: source Excel file name
+        :param open_workbook: function that opens source file as a workbook with worksheets whose rows are streamed
+            by iter_rows(values_only=True), e.g. open_workbook of the reader of source file.
+            Default openpyxl read-only workbook
+        """
+        self._source_file_name = source_file_name
+        self._open_workbook = open_workbook or HandleXLSX.open_workbook
+
+    def save(self, file_name, sheet_values):
+        """
+        :param file_name: output file name, it can't be the source file
+        :param sheet_values: {sheet title: {row number: {column number: value}}}, numbers are from 1
+        :return:
+        """
+        assert os.path.abspath(file_name) != os.path.abspath(self._source_file_name), \
+            "output file can't be the source file"
+        _source_work_book = self._open_workbook(self._source_file_name)
+        try:
+            _output_work_book = Workbook(write_only=True)
+            for source_sheet in _source_work_book.worksheets:
+                _output_sheet = _output_work_book.create_sheet(source_sheet.title)
+                _row_values = sheet_values.get(source_sheet.title, {})
+                _last_row = 0
+                for row_number, values in enumerate(source_sheet.iter_rows(values_only=True), start=1):
+                    _output_sheet.append(self.merge_row_values(values, _row_values.get(row_number)))
+                    _last_row = row_number
+                for row_number in range(_last_row + 1, max(_row_values, default=0) + 1):
+                    _output_sheet.append(self.merge_row_values((), _row_values.get(row_number)))
+            _output_work_book.save(file_name)
+        finally:
+            _source_work_book.close()
+
+    @staticmethod
+    def merge_row_values(row_values, new_values):
+        """
+        :param row_values: cell values of source row
+        :param new_values: {column number: value} of the row, or None
+        :return: list of cell values
+        """
+        _row_values = list(row_values)
+        if new_values:
+            _length = max(new_values)
+            if len(_row_values) < _length:
+                _row_values.extend([None] * (_length - len(_row_values)))
+            for column, value in new_values.items():
+                _row_values[column - 1] = value
+        return _row_values
+
+
 if __name__ == "__main__":
     print("###" * 30)
     filename = '报名表单数据.xlsx'
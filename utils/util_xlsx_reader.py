@@ -0,0 +1,482 @@
+# -*- coding:utf-8 -*-
+__author__ = 'shijin'
+"""
+Column-projected Excel reader, parses sheet XML inside the .xlsx zip incrementally and keeps only requested columns
+"""
+
+import os
+import sys
+import zipfile
+import posixpath
+from xml.etree.ElementTree import iterparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl.cell.text import Text
+from openpyxl.cell.read_only import ReadOnlyCell, EMPTY_CELL
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import column_index_from_string, range_boundaries
+from openpyxl.utils.datetime import from_excel, from_ISO8601, WINDOWS_EPOCH, CALENDAR_MAC_1904
+from utils.util_xlsx import HandleXLSX
+from row_object import RowObject, RowStatus
+
+SHEET_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+ROW_TAG = '{%s}row' % SHEET_MAIN_NS
+CELL_TAG = '{%s}c' % SHEET_MAIN_NS
+VALUE_TAG = '{%s}v' % SHEET_MAIN_NS
+INLINE_STRING_TAG = '{%s}is' % SHEET_MAIN_NS
+DIMENSION_TAG = '{%s}dimension' % SHEET_MAIN_NS
+SHEET_DATA_TAG = '{%s}sheetData' % SHEET_MAIN_NS
+
+
+class XLSXReaderError(Exception):
+    pass
+
+
+def cast_number(value):
+    """
+    Convert number text to int or float, same as openpyxl
+    :param value: text of number
+    :return: int or float
+    """
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+class ZipWorkbook(object):
+    """
+    Workbook parts read from the .xlsx zip: sheets, active sheet, date system, date styles and shared strings.
+    Shared strings are loaded once on first use and cached for every sheet.
+    """
+
+    def __init__(self, file_name):
+        """
+        :param file_name: Excel file name
+        """
+        self.file_name = file_name
+        self.archive = zipfile.ZipFile(file_name)
+        self.epoch = WINDOWS_EPOCH
+        self.date_formats = set()  # style ids of date formats
+        self.timedelta_formats = set()  # style ids of timedelta formats
+        self._shared_strings = None
+        self._shared_strings_path = None
+        self._sheets = []
+        self._active = 0
+
+        _workbook_path = self.get_workbook_path()
+        _relationships = self.read_relationships(_workbook_path)
+        self.read_workbook(_workbook_path, _relationships)
+        self.read_styles(_relationships)
+
+    @staticmethod
+    def get_part_path(base_path, target):
+        """
+        :param base_path: path of the part that refers to target
+        :param target: target of relationship, absolute or relative to base_path
+        :return: path in zip
+        """
+        if target.startswith('/'):
+            return target[1:]
+        return posixpath.normpath(posixpath.join(posixpath.dirname(base_path), target))
+
+    def get_relationships_path(self, path):
+        return posixpath.join(posixpath.dirname(path), '_rels', posixpath.basename(path) + '.rels')
+
+    def read_relationships(self, path):
+        """
+        :param path: path of part in zip
+        :return: {relationship id: (type, path of target)}
+        """
+        _relationships = {}
+        _relationships_path = self.get_relationships_path(path)
+        if _relationships_path not in self.archive.namelist():
+            return _relationships
+        with self.archive.open(_relationships_path) as source:
+            for _, element in iterparse(source):
+                if element.tag == '{%s}Relationship' % PACKAGE_RELATIONSHIPS_NS:
+                    _relationships[element.get('Id')] = (element.get('Type', '').rsplit('/', 1)[-1],
+                                                         self.get_part_path(path, element.get('Target', '')))
+        return _relationships
+
+    def get_workbook_path(self):
+        for _type, path in self.read_relationships('').values():
+            if _type == 'officeDocument':
+                return path
+        raise XLSXReaderError(f'{self.file_name} has no workbook part')
+
+    def read_workbook(self, workbook_path, relationships):
+        """
+        Read sheets, active sheet and date system
+        :param workbook_path: path of workbook part
+        :param relationships: relationships of workbook part
+        :return:
+        """
+        with self.archive.open(workbook_path) as source:
+            for _, element in iterparse(source):
+                if element.tag == '{%s}sheet' % SHEET_MAIN_NS:
+                    _type, path = relationships[element.get('{%s}id' % RELATIONSHIPS_NS)]
+                    self._sheets.append(ZipWorksheet(self, element.get('name'), path))
+                elif element.tag == '{%s}workbookView' % SHEET_MAIN_NS and not self._active:
+                    self._active = int(element.get('activeTab', 0))
+                elif element.tag == '{%s}workbookPr' % SHEET_MAIN_NS:
+                    if element.get('date1904') in ('1', 'true'):
+                        self.epoch = CALENDAR_MAC_1904
+        for _type, path in relationships.values():
+            if _type == 'sharedStrings':
+                self._shared_strings_path = path
+
+    def read_styles(self, relationships):
+        """
+        Index the styles whose number format is date or timedelta, the cell values of them are converted
+        :param relationships: relationships of workbook part
+        :return:
+        """
+        _styles_path = None
+        for _type, path in relationships.values():
+            if _type == 'styles':
+                _styles_path = path
+        if _styles_path is None or _styles_path not in self.archive.namelist():
+            return
+
+        _custom_formats = {}
+        _style_format_ids = []
+        with self.archive.open(_styles_path) as source:
+            _in_cell_styles = False
+            for event, element in iterparse(source, events=('start', 'end')):
+                if element.tag == '{%s}cellXfs' % SHEET_MAIN_NS:
+                    _in_cell_styles = event == 'start'
+                elif event == 'end' and element.tag == '{%s}numFmt' % SHEET_MAIN_NS:
+                    _custom_formats[int(element.get('numFmtId'))] = element.get('formatCode')
+                elif event == 'end' and element.tag == '{%s}xf' % SHEET_MAIN_NS and _in_cell_styles:
+                    _style_format_ids.append(int(element.get('numFmtId', 0)))
+
+        for style_id, format_id in enumerate(_style_format_ids):
+            _format = _custom_formats[format_id] if format_id in _custom_formats else builtin_format_code(format_id)
+            if is_date_format(_format):
+                self.date_formats.add(style_id)
+            if is_timedelta_format(_format):
+                self.timedelta_formats.add(style_id)
+
+    @property
+    def shared_strings(self):
+        if self._shared_strings is None:
+            if self._shared_strings_path and self._shared_strings_path in self.archive.namelist():
+                with self.archive.open(self._shared_strings_path) as source:
+                    self._shared_strings = read_string_table(source)
+            else:
+                self._shared_strings = []
+        return self._shared_strings
+
+    @property
+    def worksheets(self):
+        return list(self._sheets)
+
+    @property
+    def sheetnames(self):
+        return [sheet.title for sheet in self._sheets]
+
+    @property
+    def active(self):
+        return self._sheets[self._active] if self._active < len(self._sheets) else self._sheets[0]
+
+    def __getitem__(self, sheet_name):
+        for sheet in self._sheets:
+            if sheet.title == sheet_name:
+                return sheet
+        raise KeyError(f'Worksheet {sheet_name} does not exist.')
+
+    def close(self):
+        self.archive.close()
+
+
+class ZipWorksheet(object):
+    """
+    Sheet of ZipWorkbook, rows are parsed from sheet XML by iterparse on demand with the values that Excel calculated.
+    Only the cells in requested columns are converted, the others are skipped by their reference.
+    """
+
+    def __init__(self, parent, title, path):
+        """
+        :param parent: instance of ZipWorkbook
+        :param title: sheet title
+        :param path: path of sheet part in zip
+        """
+        self.parent = parent
+        self.title = title
+        self.path = path
+        self._max_row = None
+        self._max_column = None
+        self._dimension_read = False
+        self._column_indexes = {}  # column letters -> column number
+
+    @property
+    def max_row(self):
+        self.read_dimension()
+        return self._max_row
+
+    @property
+    def max_column(self):
+        self.read_dimension()
+        return self._max_column
+
+    def read_dimension(self):
+        """
+        Read dimension recorded before sheet data, the rows are not parsed
+        :return:
+        """
+        if self._dimension_read:
+            return
+        self._dimension_read = True
+        with self.parent.archive.open(self.path) as source:
+            for event, element in iterparse(source, events=('start',)):
+                if element.tag == DIMENSION_TAG:
+                    _min_column, _min_row, _max_column, _max_row = range_boundaries(element.get('ref'))
+                    self._max_row, self._max_column = _max_row, _max_column
+                    break
+                if element.tag == SHEET_DATA_TAG:
+                    break
+
+    def calculate_dimension(self, force=False):
+        """
+        Scan rows to get dimension if sheet doesn't record it, same as openpyxl read-only worksheet
+        :param force: if force is False, unsized sheet raises ValueError instead of being scanned
+        :return:
+        """
+        if self.max_row and self.max_column:
+            return
+        if not force:
+            raise ValueError("Worksheet is unsized, use calculate_dimension(force=True)")
+        _max_row = _max_column = 0
+        for row_number, row in self.iter_row_elements():
+            _last_column = 0
+            for cell in row:
+                if cell.tag == CELL_TAG:
+                    _reference = cell.get('r')
+                    _last_column = self.get_column_index(_reference) if _reference else _last_column + 1
+            if _last_column:
+                _max_row = row_number
+                _max_column = max(_max_column, _last_column)
+        self._max_row, self._max_column = _max_row, _max_column
+
+    def get_column_index(self, reference):
+        """
+        :param reference: cell reference, e.g. 'B12'
+        :return: column number
+        """
+        _letters = reference.rstrip('0123456789')
+        _index = self._column_indexes.get(_letters)
+        if _index is None:
+            _index = self._column_indexes[_letters] = column_index_from_string(_letters)
+        return _index
+
+    def iter_row_elements(self):
+        """
+        Parse sheet XML incrementally by iterparse, each row element is cleared after it's used like openpyxl
+        read-only worksheet, so memory doesn't hold the cells of parsed rows
+        :return: iterator of (row number, row element)
+        """
+        _row_number = 0
+        with self.parent.archive.open(self.path) as source:
+            for _, element in iterparse(source):
+                if element.tag == ROW_TAG:
+                    _reference = element.get('r')
+                    _row_number = int(float(_reference)) if _reference else _row_number + 1
+                    yield _row_number, element
+                    element.clear()
+
+    def iter_cells(self, columns=None):
+        """
+        Parse rows in sheet XML incrementally, only the cells in columns are converted,
+        the cells after the last column are not visited because cells of a row are in column order
+        :param columns: list of column numbers to convert, None means all columns
+        :return: iterator of (row number, [(column number, value, data type)]), only rows recorded in sheet
+        """
+        _columns = set(columns) if columns is not None else None
+        _last_column = max(_columns, default=0) if _columns is not None else None
+        for row_number, row in self.iter_row_elements():
+            _cells = []
+            _column = 0
+            for cell in row:
+                if cell.tag != CELL_TAG:
+                    continue
+                _reference = cell.get('r')
+                _column = self.get_column_index(_reference) if _reference else _column + 1
+                if _columns is None or _column in _columns:
+                    _cells.append((_column,) + self.get_cell_value(cell))
+                if _last_column is not None and _column >= _last_column:
+                    break
+            yield row_number, _cells
+
+    def get_cell_value(self, cell):
+        """
+        Convert cell value like openpyxl read-only workbook with data_only
+        :param cell: cell element
+        :return: value, data type
+        """
+        _data_type = cell.get('t', 'n')
+        if _data_type == 'inlineStr':
+            _child = cell.find(INLINE_STRING_TAG)
+            if _child is None:
+                return None, _data_type
+            return Text.from_tree(_child).content, 's'
+
+        _value = cell.findtext(VALUE_TAG, None) or None
+        if _value is None:
+            return None, _data_type
+        if _data_type == 'n':
+            _value = cast_number(_value)
+            _style_id = int(cell.get('s', 0))
+            if _style_id in self.parent.date_formats:
+                try:
+                    return from_excel(_value, self.parent.epoch,
+                                      timedelta=_style_id in self.parent.timedelta_formats), 'd'
+                except (OverflowError, ValueError):
+                    return '#VALUE!', 'e'
+        elif _data_type == 's':
+            _value = self.parent.shared_strings[int(_value)]
+        elif _data_type == 'b':
+            _value = bool(int(_value))
+        elif _data_type == 'str':
+            _data_type = 's'
+        elif _data_type == 'd':
+            _value = from_ISO8601(_value)
+        return _value, _data_type
+
+    def iter_projected_rows(self, columns=None, min_row=1, max_row=None):
+        """
+        :param columns: list of column numbers, None means all columns of the row
+        :param min_row: the first row number
+        :param max_row: the last row number, default max row of sheet
+        :return: iterator of (row number, {column number: value}), rows missing in sheet are yielded as empty dict
+            like openpyxl, the missing rows at the end are yielded only if sheet has rows after max_row
+        """
+        _max_row = max_row or self.max_row
+        _counter = min_row
+        for row_number, cells in self.iter_cells(columns):
+            if _max_row is not None and row_number > _max_row:
+                for missing_row_number in range(_counter, _max_row + 1):
+                    yield missing_row_number, {}
+                return
+            if row_number < _counter:
+                continue
+            for missing_row_number in range(_counter, row_number):
+                yield missing_row_number, {}
+            yield row_number, {column: value for column, value, _data_type in cells}
+            _counter = row_number + 1
+
+    def iter_rows(self, min_row=None, max_row=None, min_col=None, max_col=None, values_only=False):
+        """
+        Same rows as iter_rows of openpyxl read-only worksheet
+        :param min_row: the first row number, default 1
+        :param max_row: the last row number, default max row of sheet
+        :param min_col: the first column number, default 1
+        :param max_col: the last column number, default max column of sheet
+        :param values_only: yield values instead of cells
+        :return: iterator of tuples
+        """
+        _min_row = min_row or 1
+        _min_col = min_col or 1
+        _max_col = max_col or self.max_column
+        _max_row = max_row or self.max_row
+        _counter = _min_row
+        _filler = None if values_only else EMPTY_CELL
+        _empty_row = (_filler,) * (_max_col + 1 - _min_col) if _max_col else ()
+
+        for row_number, cells in self.iter_cells():
+            if _max_row is not None and row_number > _max_row:
+                for _ in range(_counter, _max_row + 1):
+                    yield _empty_row
+                return
+            if row_number < _counter:
+                continue
+            for _ in range(_counter, row_number):
+                yield _empty_row
+            if _max_col:
+                cells = [cell for cell in cells if cell[0] <= _max_col]
+            _counter = row_number + 1
+            if not cells and not _max_col:
+                yield ()
+                continue
+            _row = [_filler] * ((_max_col or cells[-1][0]) + 1 - _min_col)
+            for column, value, data_type in cells:
+                if column >= _min_col:
+                    _row[column - _min_col] = value if values_only else ReadOnlyCell(self, row_number, column, value,
+                                                                                     data_type)
+            yield tuple(_row)
+
+
+class ProjectedXLSX(HandleXLSX):
+    """
+    Read-only HandleXLSX backed by ZipWorkbook, row objects only carry the requested columns.
+    Parse time and memory scale with the requested columns instead of the sheet width.
+    Written values are kept until save and saved by StreamWorkbookWriter, like read-only HandleXLSX.
+    """
+
+    def __init__(self, file_name, sheet_name=None, columns=None, **kwargs):
+        """
+        :param file_name: The excel file name
+        :param sheet_name: The sheet name in excel file
+        :param columns: column names that row objects carry, None means all columns
+        :param kwargs:
+        """
+        self.columns = list(columns) if columns else None
+        kwargs['read_only'] = True
+        super(ProjectedXLSX, self).__init__(file_name, sheet_name, **kwargs)
+
+    @property
+    def work_book(self):
+        return self._work_book
+
+    @work_book.setter
+    def work_book(self, file_name):
+        self._work_book = ZipWorkbook(file_name)
+
+    def get_projection(self, column_name_list):
+        """
+        Get the requested columns in sheet, a duplicate column name refers to its last column like column_value
+        :param column_name_list: column name list of sheet
+        :return: list of (column name, column number)
+        """
+        _all_columns = [(column_name, number) for number, column_name in enumerate(column_name_list, start=1)]
+        if self.columns is None:
+            return _all_columns
+        _column_numbers = dict(_all_columns)
+        _projection = [(column_name, _column_numbers[column_name]) for column_name in self.columns
+                       if column_name in _column_numbers]
+        # None of the requested columns is in sheet, keep all columns so the rows are still handled
+        return _projection or _all_columns
+
+    def generate_row_object_iterator(self, check_file, sheet_name=None, start_point=None, end_point=None, **kwargs):
+        """
+        :param check_file:
+        :param sheet_name: sheet name
+        :param start_point: the start row number of the sheet
+        :param end_point: the end row number of the sheet
+        :param kwargs:
+        :return: row object iterator, row_value and column_value only have the requested columns,
+            column_name is still the column name list of sheet
+        """
+        column_name_list = self.get_column_name_list(sheet_name, **kwargs)
+        _start_point, _end_point = self.get_rows_start_end(start_point, end_point, **kwargs)
+        _projection = self.get_projection(column_name_list)
+        _column_numbers = [column_number for _column_name, column_number in _projection]
+        _column_names = [column_name for column_name, _column_number in _projection]
+        _status = RowStatus.INITIAL.value if check_file is False else RowStatus.CHECK.value
+
+        for row_number, values in self.sheet.iter_projected_rows(_column_numbers, _start_point, _end_point):
+            row_value_list = [self.get_format_value(values.get(column_number), **kwargs)
+                              for column_number in _column_numbers]
+            row_object = RowObject()
+            row_object.file_name = self._file_name
+            row_object.sheet_name = self.sheet.title
+            row_object.column_name = column_name_list
+            row_object.row_value = row_value_list
+            row_object.column_value = dict(zip(_column_names, row_value_list))
+            row_object.position = row_number
+            row_object.status = _status
+            yield row_object